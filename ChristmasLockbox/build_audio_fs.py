@@ -0,0 +1,243 @@
+import argparse
+import glob
+import os
+import struct
+import sys
+import zlib
+
+from convert_audio import FLASH_BUDGET, SOURCE_DIR, pack, parse_size, size_report
+
+# Builds a data-partition image of the lockbox sounds, so changing a sound
+# is a partition upload instead of a firmware rebuild + full flash.
+#
+# Layout (little-endian):
+#   header   "LBAF", u16 version, u16 count, u32 align, u32 used bytes,
+#            u32 CRC-32 of everything after the header up to "used"
+#   index    count x (u32 name offset, u16 name length, u16 reserved,
+#                     u32 data offset, u32 data length, u32 data CRC-32)
+#            sorted by name bytes (strcmp order) for binary search
+#   names    UTF-8 file names, not NUL-terminated
+#   data     each asset starts on an `align` boundary (a flash sector by
+#            default) so it can be streamed straight from flash; identical
+#            assets share one copy
+# The rest of the partition is 0xFF (erased flash).
+
+IMAGE_FILE = "audio_fs.bin"
+C_HEADER = "audio_fs.h"
+PARTITION_NAME = "audio"
+PARTITION_SUBTYPE = 0x40  # first custom data subtype
+DATA_ALIGN = 4096
+
+MAGIC = b"LBAF"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII")
+ENTRY = struct.Struct("<IHHIII")
+
+def _align(n, align):
+    return -(-n // align) * align
+
+def build_image(assets, align=DATA_ALIGN, size=None):
+    """Pack convert_audio.pack() entries into an image; returns bytes."""
+    entries = sorted(assets, key=lambda a: a["fname"].encode("utf-8"))
+    names = b""
+    name_spans = []
+    for a in entries:
+        encoded = a["fname"].encode("utf-8")
+        name_spans.append((len(names), len(encoded)))
+        names += encoded
+
+    index_end = HEADER.size + ENTRY.size * len(entries)
+    data_start = _align(index_end + len(names), align)
+    placed = {}
+    data = bytearray()
+    for a in entries:
+        original = a["dup_of"] or a
+        if original["sha256"] not in placed:
+            pos = _align(data_start + len(data), align)
+            data += b"\xff" * (pos - data_start - len(data))
+            placed[original["sha256"]] = pos
+            data += original["data"]
+
+    index = b"".join(
+        ENTRY.pack(index_end + name_off, name_len, 0, placed[(a["dup_of"] or a)["sha256"]],
+                   len(a["data"]), zlib.crc32(a["data"]))
+        for a, (name_off, name_len) in zip(entries, name_spans)
+    )
+    body = index + names + b"\xff" * (data_start - index_end - len(names)) + bytes(data)
+    used = HEADER.size + len(body)
+    header = HEADER.pack(MAGIC, VERSION, len(entries), align, used, zlib.crc32(body))
+    image = header + body
+    if size is not None:
+        if used > size:
+            raise ValueError(f"Image needs {used} bytes, partition is {size}")
+        image += b"\xff" * (size - used)
+    return image
+
+def read_index(image):
+    """Returns (align, [(name, offset, length, crc), ...]) from an image."""
+    magic, version, count, align, used, crc = HEADER.unpack_from(image, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an audio FS image")
+    if version != VERSION:
+        raise ValueError(f"Unsupported image version {version}")
+    if used > len(image) or zlib.crc32(image[HEADER.size:used]) != crc:
+        raise ValueError("Image CRC mismatch")
+    entries = []
+    for i in range(count):
+        name_off, name_len, _, offset, length, data_crc = ENTRY.unpack_from(image, HEADER.size + i * ENTRY.size)
+        name = bytes(image[name_off:name_off + name_len]).decode("utf-8")
+        entries.append((name, offset, length, data_crc))
+    return align, entries
+
+def lookup(image, name):
+    # Same binary search the sketch does (see audio_fs.h)
+    _, entries = read_index(image)
+    key = name.encode("utf-8")
+    lo, hi = 0, len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        probe = entries[mid][0].encode("utf-8")
+        if probe == key:
+            _, offset, length, _ = entries[mid]
+            return bytes(image[offset:offset + length])
+        if probe < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return None
+
+def verify(image, assets):
+    # Structure, alignment and bounds, then every asset read back through
+    # lookup() against the bytes it was built from
+    align, entries = read_index(image)
+    names = [e[0].encode("utf-8") for e in entries]
+    if names != sorted(names) or len(set(names)) != len(names):
+        raise ValueError("Index is not sorted / has duplicate names")
+    for name, offset, length, crc in entries:
+        if offset % align:
+            raise ValueError(f"{name} is not {align}-byte aligned")
+        if offset + length > len(image):
+            raise ValueError(f"{name} runs past the end of the image")
+        if zlib.crc32(image[offset:offset + length]) != crc:
+            raise ValueError(f"{name} CRC mismatch")
+    for a in assets:
+        if lookup(image, a["fname"]) != a["data"]:
+            raise ValueError(f"{a['fname']} doesn't read back")
+    return len(entries)
+
+def write_c_header(path):
+    # Layout constants and a lookup over a caller-supplied flash reader
+    # (esp_partition_read on ESP32, ESP.flashRead on ESP8266)
+    with open(path, "w") as out:
+        out.write(f"""#ifndef AUDIO_FS_H
+#define AUDIO_FS_H
+
+// Generated by build_audio_fs.py - lookup for the "{PARTITION_NAME}" data partition
+
+#include <stdint.h>
+#include <string.h>
+
+#define AUDIO_FS_PARTITION "{PARTITION_NAME}"
+#define AUDIO_FS_SUBTYPE 0x{PARTITION_SUBTYPE:02x}
+#define AUDIO_FS_MAGIC "{MAGIC.decode()}"
+#define AUDIO_FS_VERSION {VERSION}
+
+struct __attribute__((packed)) AudioFsHeader {{
+  char magic[4];
+  uint16_t version;
+  uint16_t count;
+  uint32_t align;
+  uint32_t used;
+  uint32_t crc32;
+}};
+
+struct __attribute__((packed)) AudioFsEntry {{
+  uint32_t name_offset;
+  uint16_t name_len;
+  uint16_t reserved;
+  uint32_t offset;
+  uint32_t length;
+  uint32_t crc32;
+}};
+
+// Reads len bytes at offset (relative to the partition start); returns false on error
+typedef bool (*audio_fs_read_fn)(uint32_t offset, void *dst, uint32_t len);
+
+// Binary search of the sorted index: O(log n) small reads, no RAM table
+static inline bool audio_fs_find(audio_fs_read_fn read, const char *name, AudioFsEntry *out) {{
+  AudioFsHeader header;
+  if (!read(0, &header, sizeof(header)) || memcmp(header.magic, AUDIO_FS_MAGIC, 4) != 0) return false;
+  uint32_t key_len = strlen(name);
+  int32_t lo = 0, hi = (int32_t)header.count - 1;
+  char probe[32];
+  while (lo <= hi) {{
+    int32_t mid = (lo + hi) / 2;
+    AudioFsEntry entry;
+    if (!read(sizeof(header) + mid * sizeof(entry), &entry, sizeof(entry))) return false;
+    // Compare names a small piece at a time (strcmp order)
+    int cmp = 0;
+    uint32_t common = entry.name_len < key_len ? entry.name_len : key_len;
+    for (uint32_t pos = 0; cmp == 0 && pos < common; pos += sizeof(probe)) {{
+      uint32_t n = common - pos < sizeof(probe) ? common - pos : sizeof(probe);
+      if (!read(entry.name_offset + pos, probe, n)) return false;
+      cmp = memcmp(probe, name + pos, n);
+    }}
+    if (cmp == 0) cmp = (entry.name_len > key_len) - (entry.name_len < key_len);
+    if (cmp == 0) {{
+      *out = entry;
+      return true;
+    }}
+    if (cmp < 0) lo = mid + 1; else hi = mid - 1;
+  }}
+  return false;
+}}
+
+#endif
+""")
+
+def build(align=DATA_ALIGN, size=None, raw=False):
+    files = sorted(glob.glob(os.path.join(SOURCE_DIR, "*.mp3")))
+    assets = pack(files, raw=raw)
+    if assets is None:
+        return False
+    budget = size or parse_size(FLASH_BUDGET)
+    size_report(assets, budget)
+
+    try:
+        image = build_image(assets, align=align, size=size)
+        count = verify(image, assets)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+
+    # size_report() counts 4-byte alignment; the image puts every asset on
+    # an `align` boundary, so check the budget against what it really uses
+    used = HEADER.unpack_from(image, 0)[4]
+    print(f"Image uses {used} bytes with {align}-byte alignment ({used / budget:.0%} of {budget} byte budget)")
+    if used > budget:
+        print(f"Over the flash budget by {used - budget} bytes; nothing written.")
+        return False
+
+    with open(IMAGE_FILE, "wb") as f:
+        f.write(image)
+    write_c_header(C_HEADER)
+
+    part_size = _align(max(len(image), used), 4096)
+    print(f"Wrote {IMAGE_FILE}: {count} entries, {used} bytes used ({len(image)} byte image), verified")
+    print(f"Partition table entry (size must be >= 0x{part_size:x}):")
+    print(f"  {PARTITION_NAME}, data, 0x{PARTITION_SUBTYPE:02x}, , 0x{part_size:x},")
+    print(f"Flash just the sounds with: parttool.py --partition-name {PARTITION_NAME} "
+          f"write_partition --input {IMAGE_FILE}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Pack {SOURCE_DIR}/*.mp3 into an indexed flash partition image")
+    parser.add_argument("--align", type=int, default=DATA_ALIGN,
+                        help=f"alignment of each asset in bytes (default {DATA_ALIGN}, one flash sector)")
+    parser.add_argument("--size", default=None,
+                        help="partition size, e.g. 1.5M; the image is padded with 0xFF to this size")
+    parser.add_argument("--raw", action="store_true",
+                        help="pack the MP3s as they are instead of transcoding")
+    args = parser.parse_args()
+    if not build(align=args.align, size=parse_size(args.size) if args.size else None, raw=args.raw):
+        sys.exit(1)
@@ -1,45 +1,293 @@
-import os
+import argparse
 import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+# Target directory with MP3s
+SOURCE_DIR = "Audio"
+OUTPUT_HEADER = "audio_assets.h"
+ASSET_DIR = "audio_assets"  # one header (and .bin with --incbin) per MP3
+BYTES_PER_LINE = 16
+
+# Everything is transcoded to the same profile as the box stems
+# (box*_final_120s_64k_mono_22k.mp3) before it goes into flash
+PROFILE = {"channels": 1, "sample_rate": 22050, "bitrate": "64k"}
+PACK_CACHE = os.path.join(ASSET_DIR, ".packed")  # transcodes keyed by source hash + profile
+FLASH_BUDGET = "1.5M"  # bytes of flash the assets may use (--budget to override)
+ALIGN = 4  # each array starts word-aligned
+
+# "0x00," ... "0xff," as a (256, 5) byte table, so a whole file is formatted
+# with one fancy-index instead of one f-string per byte
+HEX_TABLE = np.frombuffer("".join(f"0x{b:02x}," for b in range(256)).encode("ascii"),
+                          dtype=np.uint8).reshape(256, 5)
+
+def var_name(fname):
+    # Anything that isn't valid in a C identifier becomes "_" (spaces and
+    # dots did before; dashes and "&" now do too)
+    name = re.sub(r"[^0-9A-Za-z_]", "_", fname).lower()
+    return "_" + name if name[0].isdigit() else name
+
+def format_hex(data):
+    # Same layout as before: "  0x..,0x..," with 16 bytes per line
+    arr = np.frombuffer(data, dtype=np.uint8)
+    full = len(arr) - len(arr) % BYTES_PER_LINE
+    rows = HEX_TABLE[arr[:full]].reshape(-1, BYTES_PER_LINE * 5)
+    indent = np.full((len(rows), 2), ord(" "), dtype=np.uint8)
+    newline = np.full((len(rows), 1), ord("\n"), dtype=np.uint8)
+    body = np.hstack([indent, rows, newline]).tobytes()
+    if full < len(arr):
+        body += b"  " + HEX_TABLE[arr[full:]].tobytes()
+    return body
+
+def parse_size(text):
+    units = {"k": 1024, "m": 1024 ** 2}
+    text = str(text).strip().lower().rstrip("b")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def profile_key():
+    return hashlib.sha256(json.dumps(PROFILE, sort_keys=True).encode()).hexdigest()[:12]
+
+def transcode(fpath, source_hash):
+    # Mono / lower rate / lower bitrate, metadata and cover art dropped.
+    # Cached by source hash, so unchanged sounds aren't re-encoded.
+    cache_path = os.path.join(PACK_CACHE, f"{source_hash}_{profile_key()}.mp3")
+    if not os.path.exists(cache_path):
+        if not os.path.exists(PACK_CACHE):
+            os.makedirs(PACK_CACHE)
+        tmp_path = cache_path + ".part"
+        cmd = [
+            "ffmpeg", "-v", "error", "-nostdin", "-y", "-i", fpath,
+            "-vn", "-map_metadata", "-1",
+            "-ac", str(PROFILE["channels"]), "-ar", str(PROFILE["sample_rate"]),
+            "-b:a", PROFILE["bitrate"], "-f", "mp3", tmp_path
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(tmp_path, cache_path)
+    with open(cache_path, "rb") as f:
+        return f.read()
+
+def pack(files, raw=False):
+    # One entry per file; entries whose packed bytes match an earlier one
+    # become aliases of it instead of a second copy in flash
+    assets = []
+    by_hash = {}
+    for fpath in files:
+        fname = os.path.basename(fpath)
+        with open(fpath, "rb") as f:
+            source = f.read()
+        try:
+            data = source if raw else transcode(fpath, hashlib.sha256(source).hexdigest())
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to transcode {fname}: {e.stderr.decode('utf-8', 'replace').strip()}")
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        asset = {
+            "fname": fname,
+            "name": var_name(fname),
+            "source_size": len(source),
+            "data": data,
+            "sha256": digest,
+            "dup_of": by_hash.get(digest),
+        }
+        by_hash.setdefault(digest, asset)
+        assets.append(asset)
+    return assets
+
+def flash_size(assets):
+    return sum(-(-len(a["data"]) // ALIGN) * ALIGN for a in assets if a["dup_of"] is None)
+
+def size_report(assets, budget):
+    print(f"{'asset':<48} {'source':>10} {'packed':>10} {'ratio':>6}")
+    for a in sorted(assets, key=lambda a: -len(a["data"]) if a["dup_of"] is None else 0):
+        if a["dup_of"] is not None:
+            print(f"{a['fname'][:48]:<48} {a['source_size']:>10} {'-':>10} {'dup':>6}  same as {a['dup_of']['fname']}")
+        else:
+            print(f"{a['fname'][:48]:<48} {a['source_size']:>10} {len(a['data']):>10} "
+                  f"{len(a['data']) / a['source_size']:>6.0%}")
+    total = flash_size(assets)
+    print(f"{'total':<48} {sum(a['source_size'] for a in assets):>10} {total:>10} "
+          f"({total / budget:.0%} of {budget} byte budget)")
+    return total
+
+def incbin_path(name):
+    # Absolute: gas resolves .incbin against its own cwd (the build dir under
+    # Arduino/PlatformIO), and gcc doesn't pass its -I paths to it
+    return os.path.abspath(os.path.join(ASSET_DIR, name + ".bin")).replace(os.sep, "/")
+
+def source_key(data, incbin, name):
+    return hashlib.sha256(data).hexdigest() + (f":incbin:{incbin_path(name)}" if incbin else ":array")
+
+def header_key(path):
+    # Second line of a generated asset header records what it was built from
+    try:
+        with open(path, "r") as f:
+            f.readline()
+            line = f.readline()
+    except OSError:
+        return None
+    prefix = "// source: "
+    return line[len(prefix):].strip() if line.startswith(prefix) else None
+
+def write_array_header(path, fname, name, data, key):
+    guard = f"AUDIO_ASSET_{name.upper()}_H"
+    with open(path, "wb") as out:
+        out.write(f"// {fname} ({len(data)} bytes)\n// source: {key}\n".encode())
+        out.write(f"#ifndef {guard}\n#define {guard}\n\n#include <pgmspace.h>\n\n".encode())
+        out.write(f"const uint8_t {name}[] PROGMEM = {{\n".encode())
+        out.write(format_hex(data))
+        out.write(b"\n};\n")
+        out.write(f"const unsigned int {name}_len = {len(data)};\n\n#endif\n".encode())
+
+def write_incbin_header(path, fname, name, data, key):
+    # The bytes go into <name>.bin and are pulled in by the assembler, so
+    # the compiler never parses a multi-MB initializer. The section is a
+    # COMDAT group, so every file that includes the header shares one copy.
+    bin_path = os.path.join(ASSET_DIR, name + ".bin")
+    with open(bin_path, "wb") as f:
+        f.write(data)
+    guard = f"AUDIO_ASSET_{name.upper()}_H"
+    with open(path, "w") as out:
+        out.write(f"// {fname} ({len(data)} bytes)\n// source: {key}\n")
+        out.write(f"#ifndef {guard}\n#define {guard}\n\n#include <stdint.h>\n\n")
+        out.write("#ifndef AUDIO_ASSET_SECTION\n")
+        out.write("  #ifdef ESP32\n    #define AUDIO_ASSET_SECTION \".rodata\"\n")
+        out.write("  #else\n    #define AUDIO_ASSET_SECTION \".irom.text\" // PROGMEM on ESP8266\n  #endif\n")
+        out.write("#endif\n\n")
+        out.write("asm(\n")
+        out.write(f"  \".section \" AUDIO_ASSET_SECTION \".{name},\\\"aG\\\",@progbits,{name},comdat\\n\"\n")
+        out.write("  \".balign 4\\n\"\n")
+        out.write(f"  \".global {name}\\n\"\n")
+        out.write(f"  \"{name}:\\n\"\n")
+        out.write(f"  \".incbin \\\"{incbin_path(name)}\\\"\\n\"\n")
+        out.write("  \".previous\\n\"\n")
+        out.write(");\n")
+        out.write(f"extern const uint8_t {name}[];\n")
+        out.write(f"const unsigned int {name}_len = {len(data)};\n\n#endif\n")
+
+def write_alias_header(path, fname, name, original, key):
+    guard = f"AUDIO_ASSET_{name.upper()}_H"
+    with open(path, "w") as out:
+        out.write(f"// {fname}: same bytes as {original['fname']}\n// source: {key}\n")
+        out.write(f"#ifndef {guard}\n#define {guard}\n\n")
+        out.write(f"#include \"{original['name']}.h\"\n\n")
+        out.write(f"static const uint8_t *const {name} = {original['name']};\n")
+        out.write(f"const unsigned int {name}_len = {original['name']}_len;\n\n#endif\n")
+
+def write_if_changed(path, text):
+    # Leave the index's mtime alone when nothing was added or removed
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == text:
+                return False
+    with open(path, "w") as f:
+        f.write(text)
+    return True
+
+def convert_audio(incbin=False, force=False, raw=False, budget=FLASH_BUDGET):
+    print(f"Scanning {SOURCE_DIR}...")
+    files = sorted(glob.glob(os.path.join(SOURCE_DIR, "*.mp3")))
+    if not os.path.exists(ASSET_DIR):
+        os.makedirs(ASSET_DIR)
+
+    assets = pack(files, raw=raw)
+    if assets is None:
+        return False
+    budget = parse_size(budget)
+    total = size_report(assets, budget)
+    if total > budget:
+        print(f"Over the flash budget by {total - budget} bytes; nothing written.")
+        return False
+
+    names = []
+    rebuilt = 0
+    for asset in assets:
+        fname, name, data = asset["fname"], asset["name"], asset["data"]
+        names.append((fname, name))
+
+        # Only assets whose bytes changed get a new header, so the firmware
+        # only recompiles what was touched
+        key = source_key(data, incbin, name)
+        if asset["dup_of"] is not None:
+            key += ":alias:" + asset["dup_of"]["name"]
+        header = os.path.join(ASSET_DIR, name + ".h")
+        if not force and header_key(header) == key:
+            continue
+
+        print(f"Processing {fname}...")
+        stale_bin = os.path.join(ASSET_DIR, name + ".bin")
+        if asset["dup_of"] is not None:
+            write_alias_header(header, fname, name, asset["dup_of"], key)
+        elif incbin:
+            write_incbin_header(header, fname, name, data, key)
+            stale_bin = None
+        else:
+            write_array_header(header, fname, name, data, key)
+        if stale_bin and os.path.exists(stale_bin):
+            os.remove(stale_bin)
+        rebuilt += 1
+
+    # Headers/.bins of MP3s that were removed or renamed, so a sketch that
+    # still includes one fails to build instead of using stale audio
+    live = {name + ".h" for _, name in names}
+    if incbin:
+        live |= {a["name"] + ".bin" for a in assets if a["dup_of"] is None}
+    removed = 0
+    for fname in os.listdir(ASSET_DIR):
+        if fname.endswith((".h", ".bin")) and fname not in live:
+            os.remove(os.path.join(ASSET_DIR, fname))
+            removed += 1
+
+    # Top-level header: includes every asset and indexes them by file name
+    lines = [
+        "#ifndef AUDIO_ASSETS_H",
+        "#define AUDIO_ASSETS_H",
+        "",
+        "#include <pgmspace.h>",
+        "",
+    ]
+    lines += [f"#include \"{ASSET_DIR}/{name}.h\"" for _, name in names]
+    lines += [
+        "",
+        "struct AudioAsset {",
+        "  const char *name;",
+        "  const uint8_t *data;",
+        "  unsigned int len;",
+        "};",
+        "",
+        "static const AudioAsset AUDIO_ASSETS[] = {",
+    ]
+    lines += [f"  {{\"{fname}\", {name}, {name}_len}}," for fname, name in names]
+    lines += [
+        "};",
+        f"static const unsigned int AUDIO_ASSET_COUNT = {len(names)};",
+        "",
+        "#endif",
+        "",
+    ]
+    index_changed = write_if_changed(OUTPUT_HEADER, "\n".join(lines))
 
-def convert_audio():
-    # Target directory with MP3s
-    source_dir = "Audio"
-    output_header = "audio_assets.h"
-    
-    print(f"Scanning {source_dir}...")
-    files = glob.glob(os.path.join(source_dir, "*.mp3"))
-    
-    with open(output_header, "w") as out:
-        out.write("#ifndef AUDIO_ASSETS_H\n")
-        out.write("#define AUDIO_ASSETS_H\n\n")
-        out.write("#include <pgmspace.h>\n\n")
-        
-        for fpath in files:
-            fname = os.path.basename(fpath)
-            var_name = fname.replace(" ", "_").replace(".", "_").lower()
-            
-            print(f"Processing {fname}...")
-            
-            with open(fpath, "rb") as f:
-                data = f.read()
-                
-            out.write(f"// {fname} ({len(data)} bytes)\n")
-            out.write(f"const uint8_t {var_name}[] PROGMEM = {{\n")
-            
-            # Write hex data
-            for i, byte in enumerate(data):
-                if i % 16 == 0:
-                    out.write("  ")
-                out.write(f"0x{byte:02x},")
-                if i % 16 == 15:
-                    out.write("\n")
-            
-            out.write("\n};\n")
-            out.write(f"const unsigned int {var_name}_len = {len(data)};\n\n")
-            
-        out.write("#endif\n")
-        
-    print(f"Done! Generated {output_header}")
+    print(f"Done! {rebuilt}/{len(names)} asset headers regenerated in {ASSET_DIR}/, "
+          f"{removed} stale files removed, {OUTPUT_HEADER} {'updated' if index_changed else 'unchanged'}")
+    return True
 
 if __name__ == "__main__":
-    convert_audio()
+    parser = argparse.ArgumentParser(description=f"Pack {SOURCE_DIR}/*.mp3 into PROGMEM arrays within a flash budget")
+    parser.add_argument("--incbin", action="store_true",
+                        help="store each asset as a .bin pulled in with the assembler's .incbin")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate every asset header even if its source is unchanged")
+    parser.add_argument("--raw", action="store_true",
+                        help="embed the MP3s as they are instead of transcoding to PROFILE")
+    parser.add_argument("--budget", default=FLASH_BUDGET,
+                        help=f"flash available for assets, e.g. 900k or 1.5M (default {FLASH_BUDGET})")
+    args = parser.parse_args()
+    if not convert_audio(incbin=args.incbin, force=args.force, raw=args.raw, budget=args.budget):
+        sys.exit(1)
@@ -0,0 +1,250 @@
+import argparse
+import math
+import subprocess
+import sys
+
+import numpy as np
+from scipy import ndimage, signal
+
+from normalize_audio import LOUDNORM, PRE_CHAIN, measure
+from pcm_cache import load_pcm
+
+# In-process version of normalize_audio.py's ffmpeg chain (highpass, three
+# peaking EQs, compand, loudnorm) for audio that is already decoded, e.g.
+# the stems in generate_show_assets.py, so they can be normalized before
+# their one encode instead of encoded, decoded and re-encoded by ffmpeg.
+#
+# Biquads use ffmpeg's (RBJ cookbook) coefficients and the compressor
+# follows af_compand's envelope and transfer curve. Loudness is BS.1770-4
+# (K-weighting, 400 ms blocks, -70 LUFS / -10 LU gates) with a single
+# linear gain, as in loudnorm's two-pass linear mode; where that gain would
+# push the true peak over the ceiling a short look-ahead limiter catches
+# the peaks (loudnorm switches to its dynamic mode there instead). Run this
+# file on an MP3 to check it against ffmpeg.
+
+HIGHPASS_HZ = 250
+EQ_BANDS = [(850, 2.0), (3000, 4.0), (6000, 2.0)]  # (Hz, dB), one octave wide
+COMPAND_ATTACK = 0.01
+COMPAND_DECAY = 0.1
+COMPAND_POINTS = [(-80.0, -80.0), (-15.0, -15.0), (0.0, -3.0)]  # (in dB, out dB)
+TARGET_I = -14.0
+TARGET_TP = -1.0
+LIMITER_MS = 5
+
+# Validation tolerances against the ffmpeg chain
+MIN_SNR_DB = 30.0
+MAX_LOUDNESS_DIFF_LU = 0.5
+
+def _sos(b, a):
+    return np.array([b[0] / a[0], b[1] / a[0], b[2] / a[0], 1.0, a[1] / a[0], a[2] / a[0]])
+
+def highpass_sos(freq, fs, q=0.707):
+    # ffmpeg highpass defaults: 2 poles, width_type=q, width=0.707
+    w0 = 2 * math.pi * freq / fs
+    alpha = math.sin(w0) / (2 * q)
+    c = math.cos(w0)
+    return _sos([(1 + c) / 2, -(1 + c), (1 + c) / 2], [1 + alpha, -2 * c, 1 - alpha])
+
+def peaking_sos(freq, fs, gain_db, octaves=1.0):
+    # ffmpeg equalizer with width_type=o
+    w0 = 2 * math.pi * freq / fs
+    alpha = math.sin(w0) * math.sinh(math.log(2) / 2 * octaves * w0 / math.sin(w0))
+    a = 10 ** (gain_db / 40)
+    c = math.cos(w0)
+    return _sos([1 + alpha * a, -2 * c, 1 - alpha * a], [1 + alpha / a, -2 * c, 1 - alpha / a])
+
+def eq_sos(fs):
+    return np.array([highpass_sos(HIGHPASS_HZ, fs)] + [peaking_sos(f, fs, g) for f, g in EQ_BANDS])
+
+def _follow(level, attack, decay, start, block=2048, max_iter=50):
+    # af_compand's volume follower, per sample:
+    #   v += (level - v) * (attack if level > v else decay)
+    # Inside a block, once we know which samples are attacks, this is a
+    # linear recursion that closes with cumulative products. Guess the
+    # attack pattern from the previous estimate and repeat until it stops
+    # changing (a few passes); fall back to the plain loop if it doesn't.
+    out = np.empty_like(level)
+    v0 = start
+    for lo in range(0, len(level), block):
+        x = level[lo:lo + block]
+        prev = np.broadcast_to(v0, x.shape)
+        for _ in range(max_iter):
+            coef = np.where(x > prev, attack, decay)
+            keep = np.cumprod(1 - coef, axis=0)
+            v = keep * (v0 + np.cumsum(coef * x / keep, axis=0))
+            shifted = np.concatenate([v0[None], v[:-1]])
+            if np.array_equal(x > shifted, x > prev):
+                break
+            prev = shifted
+        else:
+            v = np.empty_like(x)
+            cur = v0.copy()
+            for i in range(len(x)):
+                cur += (x[i] - cur) * np.where(x[i] > cur, attack, decay)
+                v[i] = cur
+        out[lo:lo + block] = v
+        v0 = v[-1]
+    return out
+
+def compand_gain(volume, points=COMPAND_POINTS):
+    # Gain for a follower level: the transfer curve (linear in dB between
+    # points, straight on past the ends) minus the input level
+    xs = np.array([p[0] for p in points])
+    ys = np.array([p[1] for p in points])
+    with np.errstate(divide="ignore"):
+        in_db = 20 * np.log10(np.maximum(volume, 1e-20))
+    out_db = np.interp(in_db, xs, ys)
+    hi = in_db > xs[-1]
+    out_db[hi] = ys[-1] + (in_db[hi] - xs[-1]) * (ys[-1] - ys[-2]) / (xs[-1] - xs[-2])
+    out_db[in_db < xs[0]] = in_db[in_db < xs[0]] + ys[0] - xs[0]
+    return 10 ** ((out_db - in_db) / 20)
+
+def compand(x, fs, attack=COMPAND_ATTACK, decay=COMPAND_DECAY, points=COMPAND_POINTS):
+    # Each channel follows its own level, starting from 0 dB like ffmpeg
+    attack_coef = 1.0 - math.exp(-1.0 / (fs * attack)) if attack > 1.0 / fs else 1.0
+    decay_coef = 1.0 - math.exp(-1.0 / (fs * decay)) if decay > 1.0 / fs else 1.0
+    volume = _follow(np.abs(x), attack_coef, decay_coef, np.ones(x.shape[1]))
+    return x * compand_gain(volume, points)
+
+def k_weighting_sos(fs):
+    # BS.1770 pre-filter (high shelf) and RLB high-pass, derived for any rate
+    g, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    a = 10 ** (g / 40)
+    w0 = 2 * math.pi * fc / fs
+    alpha = math.sin(w0) / (2 * q)
+    c = math.cos(w0)
+    shelf = _sos(
+        [a * ((a + 1) + (a - 1) * c + 2 * math.sqrt(a) * alpha),
+         -2 * a * ((a - 1) + (a + 1) * c),
+         a * ((a + 1) + (a - 1) * c - 2 * math.sqrt(a) * alpha)],
+        [(a + 1) - (a - 1) * c + 2 * math.sqrt(a) * alpha,
+         2 * ((a - 1) - (a + 1) * c),
+         (a + 1) - (a - 1) * c - 2 * math.sqrt(a) * alpha])
+    hp = highpass_sos(38.13547087602444, fs, q=0.5003270373238773)
+    return np.array([shelf, hp])
+
+def integrated_loudness(x, fs):
+    """BS.1770 gated integrated loudness in LUFS of a (frames, channels) float array."""
+    weighted = signal.sosfilt(k_weighting_sos(fs), x, axis=0)
+    block, step = int(0.4 * fs), int(0.1 * fs)
+    if len(weighted) < block:
+        return -float("inf")
+
+    # Mean square of every 400 ms block (75% overlap) from one prefix sum
+    power = np.concatenate([np.zeros(1), np.cumsum(np.sum(weighted ** 2, axis=1))])
+    starts = np.arange(0, len(weighted) - block + 1, step)
+    z = (power[starts + block] - power[starts]) / block
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(z)
+
+    gated = z[loudness > -70]
+    if not len(gated):
+        return -float("inf")
+    relative = -0.691 + 10 * math.log10(gated.mean()) - 10
+    gated = z[(loudness > -70) & (loudness > relative)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+def _oversampled_peaks(x, oversample=4):
+    # Per-frame peak over all channels of a 4x oversampled copy (BS.1770 annex 2)
+    up = signal.resample_poly(x, oversample, 1, axis=0)[:len(x) * oversample]
+    return np.abs(up).reshape(len(x), oversample * x.shape[1]).max(axis=1)
+
+def true_peak(x):
+    peak = _oversampled_peaks(x).max() if x.size else 0.0
+    return 20 * math.log10(peak) if peak > 0 else -float("inf")
+
+def limit(x, fs, ceiling_db=TARGET_TP, window_ms=LIMITER_MS):
+    # Look-ahead peak limiter, linked across channels. The gain each frame
+    # needs is spread over +-window with a minimum filter and then smoothed
+    # with a box half as wide, so the smoothed gain never exceeds what any
+    # frame needs.
+    ceiling = 10 ** (ceiling_db / 20)
+    need = np.minimum(1.0, ceiling / np.maximum(_oversampled_peaks(x), 1e-12))
+    w = max(1, int(fs * window_ms / 1000))
+    need = ndimage.minimum_filter1d(need, 2 * w + 1, mode="nearest")
+    gain = ndimage.uniform_filter1d(need, w + 1, mode="nearest")
+    return x * gain[:, None]
+
+def pre_chain(x, fs):
+    # Stems are mostly digital silence, where the filter tails decay into
+    # denormals and slow every later filter ~50x. A -400 dB tone at Nyquist
+    # keeps the states normal and vanishes in the final 16-bit rounding.
+    guard = np.where(np.arange(len(x)) % 2, -1e-20, 1e-20)[:, None]
+    return compand(signal.sosfilt(eq_sos(fs), x + guard, axis=0), fs)
+
+def process(x, fs, target_i=TARGET_I, target_tp=TARGET_TP):
+    """Run the whole chain on (frames, channels) float samples in [-1, 1].
+
+    Returns (output, info) with the measured loudness and applied gain.
+    """
+    y = pre_chain(np.asarray(x, dtype=np.float64), fs)
+    measured = integrated_loudness(y, fs)
+    if math.isinf(measured):
+        return y, {"input_i": measured, "gain_db": 0.0, "peak_limited": False}
+
+    gain = target_i - measured
+    out = y * 10 ** (gain / 20)
+    limited = true_peak(out) > target_tp
+    if limited:
+        # Limiting takes a little loudness off the peaks; make it up and
+        # limit again until the output lands on the target
+        for _ in range(4):
+            out = limit(y * 10 ** (gain / 20), fs, target_tp)
+            short = target_i - integrated_loudness(out, fs)
+            if abs(short) < 0.05:
+                break
+            gain += short
+    return out, {"input_i": measured, "gain_db": gain, "peak_limited": limited}
+
+def process_int16(samples, fs, **kwargs):
+    """process() for int16 (frames, channels) buffers, e.g. mixed stems."""
+    y, info = process(samples / 32768.0, fs, **kwargs)
+    return np.clip(np.round(y * 32768), -32768, 32767).astype(np.int16), info
+
+def _ffmpeg_f32(path, filter_chain, fs, channels):
+    cmd = [
+        "ffmpeg", "-hide_banner", "-v", "error", "-nostdin", "-i", path,
+        "-filter:a", filter_chain, "-ar", str(fs), "-ac", str(channels),
+        "-f", "f32le", "-"
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True).stdout
+    return np.frombuffer(out, dtype=np.float32).reshape(-1, channels).astype(np.float64)
+
+def validate(path):
+    """Compare the engine with ffmpeg on one file; returns True within tolerance."""
+    pcm = load_pcm(path, fmt="f32le")
+    fs, channels = pcm.sample_rate, pcm.channels
+    x = np.asarray(pcm.samples, dtype=np.float64)
+
+    # Filters + compressor, sample by sample
+    ours = pre_chain(x, fs)
+    theirs = _ffmpeg_f32(path, PRE_CHAIN, fs, channels)
+    n = min(len(ours), len(theirs))
+    noise = np.sum((ours[:n] - theirs[:n]) ** 2)
+    snr = 10 * math.log10(np.sum(theirs[:n] ** 2) / noise) if noise else float("inf")
+
+    # Loudness measurement against loudnorm's first pass
+    stats, stderr = measure(path)
+    if stats is None:
+        print(stderr)
+        return False
+    loudness_diff = abs(integrated_loudness(ours, fs) - float(stats["input_i"]))
+
+    # Whole chain: should land on the target like loudnorm
+    out, info = process(x, fs)
+    output_i = integrated_loudness(out, fs)
+    ok = (snr >= MIN_SNR_DB and loudness_diff <= MAX_LOUDNESS_DIFF_LU
+          and abs(output_i - TARGET_I) <= MAX_LOUDNESS_DIFF_LU and true_peak(out) <= TARGET_TP + 0.1)
+    print(f"{path}: pre-chain SNR {snr:.1f} dB, loudness {info['input_i']:.2f} vs ffmpeg "
+          f"{stats['input_i']} LUFS, gain {info['gain_db']:+.2f} dB"
+          f"{' (peak limited)' if info['peak_limited'] else ''}, output {output_i:.2f} LUFS "
+          f"{true_peak(out):.2f} dBTP -> {'ok' if ok else 'OUT OF TOLERANCE'}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Check the in-process DSP chain against ffmpeg ({LOUDNORM})")
+    parser.add_argument("files", nargs="+", help="audio files to compare")
+    args = parser.parse_args()
+    results = [validate(path) for path in args.files]
+    if not all(results):
+        sys.exit(1)
@@ -1,13 +1,31 @@
 from pydub import AudioSegment
+import numpy as np
+from pcm_cache import file_sha256, load_audio_segment, probe, stream_pcm
+from normalize_audio import FILTER_CHAIN
+import show_format
+from show_timeline import ShowTimeline
+import argparse
+import hashlib
+import heapq
 import json
 import os
 import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # CONFIG
 SOURCE_AUDIO = "Audio/ElevenLabs_2025-12-23T22_29_06_Flicker - Cheerful Fairy & Sparkly Sweetness_pvc_sp95_s0_sb100_v3.mp3"
 TRANSCRIPT_FILE = "manual_transcript.txt"
+ALIGNMENT_FILE = "www/audio/ElevenLabs_2025-12-23T22_29_06_Flicker_-_Cheerful_Fairy_Sparkly_Sweetness_pvc_sp95_s0_sb100_v3_eng.json"
 OUTPUT_DIR = "www/audio"
 SEQUENCE_FILE = "www/show_sequence.json"
+BINARY_SEQUENCE_FILE = "www/show_sequence.bin"
+TIMELINE_FILE = "www/show_timeline.json"
+EXPORT_BITRATE = "128k"
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, ".finale_manifest.json")
 
 # MAPPING
 # Box1: Sam (Shiny Buttons)
@@ -63,79 +81,485 @@ def parse_transcript():
             })
     return segments
 
-def generate_assets():
-    print(f"Loading {SOURCE_AUDIO}...")
-    original = AudioSegment.from_mp3(SOURCE_AUDIO)
-    
-    # Create silent base tracks
-    duration_ms = len(original)
-    silence = AudioSegment.silent(duration=duration_ms)
-    
-    tracks = {
-        "sam": silence,
-        "kristine": silence,
-        "jacob": silence
-    }
-    
+# Raw PCM sample width (bytes) -> numpy dtype. audioop treats every width as signed.
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def build_lighting_events(segments, speakers):
     lighting_events = []
-    
-    print("Parsing transcript...")
-    segments = parse_transcript()
-    print(f"Found {len(segments)} segments.")
-    
     for seg in segments:
         speaker = seg["box"]
-        start = seg["start"]
-        end = seg["end"]
-        
-        if speaker not in tracks:
-            print(f"Warning: Unknown speaker {speaker}")
+        if speaker not in speakers:
             continue
-            
-        print(f"Processing {speaker} ({start}-{end}): {seg['text'][:20]}...")
-        
-        # Audio Processing
-        # Extract chunk from original
-        # Safety clip
-        end = min(end, len(original))
-        audio_chunk = original[start:end]
-        
-        # Overlay onto specific track
-        tracks[speaker] = tracks[speaker].overlay(audio_chunk, position=start)
-        
-        # Lighting Events
         lighting_events.append({
-            "time": start,
+            "time": seg["start"],
             "box": speaker,
             "action": "anim",
             "type": "speaking",
             "state": "on"
         })
         lighting_events.append({
-            "time": end,
+            "time": seg["end"],
             "box": speaker,
             "action": "anim",
             "type": "speaking",
             "state": "off"
         })
-        
+
     # Sort events
     lighting_events.sort(key=lambda x: x["time"])
-    
-    # Export Audio
+    return lighting_events
+
+def iter_alignment_segments(path):
+    # Stream segments out of the ElevenLabs alignment JSON. ijson keeps memory
+    # flat on long takes; without it, fall back to a plain json.load.
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    with open(path, "rb") as f:
+        if ijson:
+            yield from ijson.items(f, "segments.item", use_float=True)
+        else:
+            yield from json.load(f)["segments"]
+
+# Same-time ordering: a box switching off sorts before another switching on
+EVENT_ORDER = {"off": 0, "on": 1, "pulse": 2}
+
+def compile_alignment_sequence(path=ALIGNMENT_FILE, pulses=False, frame_ms=None):
+    # Build show events from word-level alignment instead of the hand-kept
+    # transcript. Speaking spans are unioned per box (overlaps and, with
+    # frame_ms, gaps shorter than one frame are merged), word pulses closer
+    # than frame_ms are dropped, then the per-box streams are merged in time
+    # order.
+    frame_ms = frame_ms or 0
+    spans = {}
+    texts = {}
+    words = {}
+
+    for seg in iter_alignment_segments(path):
+        box_id = (seg.get("speaker") or {}).get("name")
+        box = BOX_MAP.get(box_id)
+        if box is None:
+            print(f"Warning: Unknown speaker {box_id}")
+            continue
+
+        start = round(seg["start_time"] * 1000)
+        end = round(seg["end_time"] * 1000)
+        spans.setdefault(box, []).append((start, end))
+        texts.setdefault((box, start), seg.get("text", "").strip())
+
+        if pulses:
+            for word in seg.get("words") or []:
+                if word.get("text", "").strip():
+                    words.setdefault(box, []).append(round(word["start_time"] * 1000))
+
+    streams = []
+    for box in spans:
+        events = []
+
+        merged = []
+        for start, end in sorted(spans[box]):
+            if merged and start - merged[-1][1] <= frame_ms:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            on = {"time": start, "box": box, "action": "anim", "type": "speaking", "state": "on"}
+            if texts.get((box, start)):
+                on["text"] = texts[(box, start)]
+            events.append(on)
+            events.append({"time": end, "box": box, "action": "anim", "type": "speaking", "state": "off"})
+
+        last = None
+        for t in sorted(words.get(box, [])):
+            if last is not None and t - last < max(frame_ms, 1):
+                continue
+            events.append({"time": t, "box": box, "action": "anim", "type": "pulse", "state": "pulse"})
+            last = t
+
+        events.sort(key=lambda e: (e["time"], EVENT_ORDER[e["state"]]))
+        streams.append(events)
+
+    return list(heapq.merge(*streams, key=lambda e: (e["time"], EVENT_ORDER[e["state"]])))
+
+def mix_stems_overlay(original, segments, speakers):
+    # Reference path: one pydub overlay per segment. Every overlay copies the
+    # whole show-length track, so this is O(segments x show length).
+    silence = AudioSegment.silent(duration=len(original))
+    tracks = {name: silence for name in speakers}
+
+    for seg in segments:
+        speaker = seg["box"]
+        if speaker not in tracks:
+            continue
+        start = seg["start"]
+        end = min(seg["end"], len(original))
+        tracks[speaker] = tracks[speaker].overlay(original[start:end], position=start)
+    return tracks
+
+def mix_stems(original, segments, speakers):
+    # Single pass: decode the source into one sample array, then copy each
+    # segment into a preallocated per-speaker buffer with slice assignment.
+    # Produces the same bytes as mix_stems_overlay().
+    silence = AudioSegment.silent(duration=len(original))
+
+    # overlay() syncs the silent base track to the source format first
+    # (frame rate, channels, sample width); do the same conversion once.
+    # (Sources below 11025 Hz would be resampled per chunk by overlay(), so
+    # only those can differ from the reference path by resampler edge effects.)
+    base, source = AudioSegment._sync(silence, original)
+    dtype = SAMPLE_DTYPES[base.sample_width]
+    info = np.iinfo(dtype)
+    channels = base.channels
+
+    samples = np.frombuffer(source.raw_data, dtype=dtype).reshape(-1, channels)
+    frame_rate = base.frame_rate
+    buffers = {name: np.zeros((int(base.frame_count()), channels), dtype=dtype) for name in speakers}
+
+    # Same ms <-> frame rounding as AudioSegment.__len__ / slicing
+    def length_ms(frames):
+        return round(1000 * (frames / frame_rate))
+
+    def to_frame(ms):
+        return int(ms * (frame_rate / 1000.0))
+
+    for seg in segments:
+        speaker = seg["box"]
+        if speaker not in buffers:
+            continue
+        buf = buffers[speaker]
+
+        # overlay() rebuilds the track from ms slices, so its frame count
+        # snaps to whole milliseconds; mirror that before mixing
+        frames = to_frame(length_ms(len(buf)))
+        if frames != len(buf):
+            resized = np.zeros((frames, channels), dtype=dtype)
+            keep = min(frames, len(buf))
+            resized[:keep] = buf[:keep]
+            buf = buffers[speaker] = resized
+
+        end = min(seg["end"], len(original))
+        src_start = to_frame(min(seg["start"], length_ms(len(samples))))
+        src_end = min(to_frame(end), len(samples))
+        pos = to_frame(min(seg["start"], length_ms(len(buf))))
+
+        count = max(0, min(src_end - src_start, len(buf) - pos))
+        if not count:
+            continue
+
+        # audioop.add saturates, so widen, add and clip like it does
+        target = buf[pos:pos + count]
+        mixed = target.astype(np.int64)
+        mixed += samples[src_start:src_start + count]
+        np.clip(mixed, info.min, info.max, out=mixed)
+        target[:] = mixed
+
+    return {name: base._spawn(buf.tobytes()) for name, buf in buffers.items()}
+
+def benchmark_mixers(original, segments, speakers):
+    print("Benchmarking overlay mixer...")
+    t0 = time.perf_counter()
+    reference = mix_stems_overlay(original, segments, speakers)
+    overlay_time = time.perf_counter() - t0
+
+    print("Benchmarking NumPy mixer...")
+    t0 = time.perf_counter()
+    tracks = mix_stems(original, segments, speakers)
+    numpy_time = time.perf_counter() - t0
+
+    for name in speakers:
+        same = reference[name].raw_data == tracks[name].raw_data
+        print(f"  {name}: {'identical' if same else 'MISMATCH'}")
+    print(f"Overlay: {overlay_time:.2f}s  NumPy: {numpy_time:.2f}s  "
+          f"Speedup: {overlay_time / max(numpy_time, 1e-9):.1f}x")
+    return tracks
+
+def normalize_stems(tracks):
+    # Run normalize_audio.py's chain in-process on the mixed samples, so the
+    # stems are normalized before their one encode (no ffmpeg round-trip)
+    import dsp
+    normalized = {}
+    for name, audio in tracks.items():
+        if audio.sample_width != 2:
+            raise ValueError(f"{name}: normalize needs 16-bit samples, got {audio.sample_width * 8}-bit")
+        t0 = time.perf_counter()
+        samples = np.frombuffer(audio.raw_data, dtype=np.int16).reshape(-1, audio.channels)
+        out, info = dsp.process_int16(samples, audio.frame_rate)
+        normalized[name] = audio._spawn(out.tobytes())
+        print(f"  {name}: {info['input_i']:.1f} LUFS, gain {info['gain_db']:+.1f} dB"
+              f"{', peak limited' if info['peak_limited'] else ''} ({time.perf_counter() - t0:.2f}s)")
+    return normalized
+
+def stem_filename(name):
+    return f"Finale_{name.capitalize()}.mp3"
+
+def _export_stem(path, raw_data, sample_width, frame_rate, channels, bitrate):
+    # Runs in a worker process: rebuild the segment from raw PCM and encode it
+    audio = AudioSegment(raw_data, sample_width=sample_width,
+                         frame_rate=frame_rate, channels=channels)
+    t0 = time.perf_counter()
+    audio.export(path, format="mp3", bitrate=bitrate)
+    return time.perf_counter() - t0
+
+def export_stems(tracks, max_workers=None):
+    # Encode every stem concurrently; one ffmpeg encoder per worker process.
+    # Returns {name: error message} for the stems that failed.
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
-        
-    for name, audio in tracks.items():
-        filename = f"Finale_{name.capitalize()}.mp3"
-        path = os.path.join(OUTPUT_DIR, filename)
-        print(f"Exporting {filename}...")
-        audio.export(path, format="mp3", bitrate="128k")
-        
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(tracks)))
+
+    print(f"Exporting {len(tracks)} stems with {max_workers} workers...")
+    failures = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for name, audio in tracks.items():
+            path = os.path.join(OUTPUT_DIR, stem_filename(name))
+            future = pool.submit(_export_stem, path, audio.raw_data, audio.sample_width,
+                                 audio.frame_rate, audio.channels, EXPORT_BITRATE)
+            futures[future] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                elapsed = future.result()
+                print(f"  {stem_filename(name)}: {elapsed:.2f}s")
+            except Exception as e:
+                failures[name] = str(e) or e.__class__.__name__
+                print(f"  {stem_filename(name)}: FAILED ({failures[name]})")
+
+    print(f"Export finished in {time.perf_counter() - t0:.2f}s "
+          f"({len(tracks) - len(failures)}/{len(tracks)} ok)")
+    return failures
+
+def stream_stems(segments, speakers, block_ms=1000):
+    # Bounded-memory alternative to mix_stems() + export_stems(): decode the
+    # source through a pipe one block at a time and write each speaker's
+    # share of the block straight into that stem's ffmpeg encoder. All
+    # encoders run at once; only one block of audio is held in memory.
+    frame_rate, channels = probe(SOURCE_AUDIO)
+    per_ms = frame_rate / 1000.0
+    info = np.iinfo(np.int16)
+
+    spans = {name: [] for name in speakers}
+    for seg in segments:
+        if seg["box"] in spans:
+            spans[seg["box"]].append((int(seg["start"] * per_ms), int(seg["end"] * per_ms)))
+
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    encoders = {}
+    for name in speakers:
+        path = os.path.join(OUTPUT_DIR, stem_filename(name))
+        log = tempfile.TemporaryFile()
+        cmd = [
+            "ffmpeg", "-y", "-v", "error", "-f", "s16le", "-ar", str(frame_rate),
+            "-ac", str(channels), "-i", "-", "-b:a", EXPORT_BITRATE, path
+        ]
+        encoders[name] = (subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=log), log)
+
+    print(f"Streaming {len(speakers)} stems...")
+    failures = {}
+    t0 = time.perf_counter()
+    f0 = 0
+    for block in stream_pcm(SOURCE_AUDIO, frame_rate, channels, block_ms=block_ms):
+        f1 = f0 + len(block)
+        for name, (proc, _) in encoders.items():
+            if name in failures:
+                continue
+            out = np.zeros_like(block)
+            for a, b in spans[name]:
+                lo, hi = max(a, f0), min(b, f1)
+                if lo < hi:
+                    mixed = out[lo - f0:hi - f0].astype(np.int32) + block[lo - f0:hi - f0]
+                    out[lo - f0:hi - f0] = np.clip(mixed, info.min, info.max)
+            try:
+                proc.stdin.write(out.tobytes())
+            except BrokenPipeError:
+                failures[name] = "encoder exited early"
+        f0 = f1
+
+    for name, (proc, log) in encoders.items():
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if proc.wait() and name not in failures:
+            log.seek(0)
+            failures[name] = log.read().decode(errors="replace").strip() or f"ffmpeg exited {proc.returncode}"
+        log.close()
+        status = f"FAILED ({failures[name]})" if name in failures else "ok"
+        print(f"  {stem_filename(name)}: {status}")
+
+    print(f"Streamed export finished in {time.perf_counter() - t0:.2f}s "
+          f"({len(speakers) - len(failures)}/{len(speakers)} ok)")
+    return failures
+
+def stem_input_hash(source_hash, segments, speaker, normalize=False, stream=False):
+    # Everything that affects one stem's bytes: the source audio, that
+    # speaker's segment timings (text edits don't change the audio), how it
+    # was mixed (--stream or in RAM) and the export settings.
+    spans = [[seg["start"], seg["end"]] for seg in segments if seg["box"] == speaker]
+    key = {
+        "source": source_hash,
+        "segments": spans,
+        "mode": "stream" if stream else "mix",
+        "format": "mp3",
+        "bitrate": EXPORT_BITRATE,
+    }
+    if normalize:
+        key["normalize"] = FILTER_CHAIN
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: ignoring unreadable manifest {MANIFEST_FILE}")
+        return {}
+
+def save_manifest(manifest):
+    with open(MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def write_sequence_if_changed(lighting_events):
+    changed = True
+    if os.path.exists(SEQUENCE_FILE):
+        try:
+            with open(SEQUENCE_FILE, "r") as f:
+                changed = json.load(f) != lighting_events
+        except (OSError, ValueError):
+            pass
+
+    if changed:
+        with open(SEQUENCE_FILE, "w") as f:
+            json.dump(lighting_events, f, indent=2)
+        print(f"Sequence saved to {SEQUENCE_FILE}")
+    else:
+        print(f"Sequence unchanged: {SEQUENCE_FILE}")
+
+    # Compact per-box timeline for the firmware
+    if changed or not os.path.exists(BINARY_SEQUENCE_FILE):
+        data = show_format.write_binary(lighting_events, BINARY_SEQUENCE_FILE)
+        for problem in show_format.validate(lighting_events, data):
+            print(f"Warning: {BINARY_SEQUENCE_FILE}: {problem}")
+        show_format.size_report(SEQUENCE_FILE, BINARY_SEQUENCE_FILE)
+
+    # Seek index for finale/simulator scrubbing
+    if changed or not os.path.exists(TIMELINE_FILE):
+        ShowTimeline(lighting_events).write_index(TIMELINE_FILE)
+        print(f"Timeline index saved to {TIMELINE_FILE}")
+    return changed
+
+def generate_assets(benchmark=False, jobs=None, force=False,
+                    alignment=None, pulses=False, frame_ms=None, stream=False, normalize=False):
+    speakers = list(dict.fromkeys(BOX_MAP.values()))
+
+    print("Parsing transcript...")
+    segments = parse_transcript()
+    print(f"Found {len(segments)} segments.")
+
+    for seg in segments:
+        if seg["box"] not in speakers:
+            print(f"Warning: Unknown speaker {seg['box']}")
+
+    if alignment:
+        print(f"Compiling sequence from {alignment}...")
+        lighting_events = compile_alignment_sequence(alignment, pulses=pulses, frame_ms=frame_ms)
+    else:
+        lighting_events = build_lighting_events(segments, speakers)
+    print(f"{len(lighting_events)} lighting events.")
+
+    # Work out which stems are stale
+    source_hash = file_sha256(SOURCE_AUDIO)
+    manifest = load_manifest()
+    stems = manifest.get("stems", {})
+    input_hashes = {name: stem_input_hash(source_hash, segments, name, normalize, stream) for name in speakers}
+
+    if benchmark and not force:
+        # The benchmark times the mix, so it needs stems to rebuild
+        print("--benchmark: rebuilding every stem")
+        force = True
+
+    stale = []
+    for name in speakers:
+        path = os.path.join(OUTPUT_DIR, stem_filename(name))
+        if force or stems.get(name) != input_hashes[name] or not os.path.exists(path):
+            stale.append(name)
+    if len(stale) < len(speakers):
+        print(f"{len(speakers) - len(stale)} stems up to date.")
+    for seg in segments:
+        if seg["box"] in stale:
+            print(f"Processing {seg['box']} ({seg['start']}-{seg['end']}): {seg['text'][:20]}...")
+
+    failures = {}
+    if stale and stream:
+        failures = stream_stems(segments, stale)
+    elif stale:
+        print(f"Loading {SOURCE_AUDIO}...")
+        original = load_audio_segment(SOURCE_AUDIO)
+
+        # Audio Processing
+        if benchmark:
+            tracks = benchmark_mixers(original, segments, stale)
+        else:
+            tracks = mix_stems(original, segments, stale)
+
+        if normalize:
+            print("Normalizing stems...")
+            tracks = normalize_stems(tracks)
+
+        # Export Audio
+        failures = export_stems(tracks, max_workers=jobs)
+
+    if stale:
+        for name in stale:
+            if name in failures:
+                stems.pop(name, None)
+            else:
+                stems[name] = input_hashes[name]
+        manifest["stems"] = stems
+        save_manifest(manifest)
+    else:
+        print("All stems up to date, skipping decode and export.")
+
     # Export Sequence
-    with open(SEQUENCE_FILE, "w") as f:
-        json.dump(lighting_events, f, indent=2)
-    print(f"Sequence saved to {SEQUENCE_FILE}")
+    write_sequence_if_changed(lighting_events)
+
+    return failures
 
 if __name__ == "__main__":
-    generate_assets()
+    parser = argparse.ArgumentParser(description="Build the finale stems and show sequence")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="also run the legacy overlay mixer, check the stems match and report the speedup (rebuilds every stem)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="max parallel stem encoders (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every stem even if its inputs are unchanged")
+    parser.add_argument("--alignment", nargs="?", const=ALIGNMENT_FILE, default=None,
+                        help="build show_sequence.json from ElevenLabs alignment JSON instead of the transcript")
+    parser.add_argument("--pulses", action="store_true",
+                        help="with --alignment, add a word-level pulse event per spoken word")
+    parser.add_argument("--frame-ms", type=int, default=None,
+                        help="with --alignment, coalesce events closer together than this many ms")
+    parser.add_argument("--stream", action="store_true",
+                        help="decode and encode block by block with bounded memory instead of mixing in RAM")
+    parser.add_argument("--normalize", action="store_true",
+                        help="run normalize_audio.py's DSP chain on each stem in-process before encoding (needs scipy)")
+    args = parser.parse_args()
+    if args.normalize and args.stream:
+        parser.error("--normalize needs whole stems for loudness gating; it can't be combined with --stream")
+    if args.benchmark and args.stream:
+        parser.error("--benchmark times the in-RAM mixers; it can't be combined with --stream")
+    if generate_assets(benchmark=args.benchmark, jobs=args.jobs, force=args.force,
+                       alignment=args.alignment, pulses=args.pulses, frame_ms=args.frame_ms,
+                       stream=args.stream, normalize=args.normalize):
+        sys.exit(1)
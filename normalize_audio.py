@@ -1,43 +1,187 @@
+import argparse
+import hashlib
+import json
 import os
+import re
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pcm_cache import file_sha256
 
 AUDIO_DIR = "www/audio"
 TEMP_DIR = "www/audio_norm"
+MEASURE_CACHE = ".loudnorm_cache.json"  # first-pass loudnorm stats per input + chain
+MANIFEST_FILE = os.path.join(TEMP_DIR, ".norm_manifest.json")
+
+# Expert DSP Chain:
+# 1. HighPass @ 250Hz (Kill power-wasting bass)
+# 2. EQ: +2dB @ 850Hz, +4dB @ 3kHz, +2dB @ 6kHz (Vocal Presence)
+# 3. Compression (Control dynamics)
+# 4. Loudness Normalization (Target -14 LUFS)
+PRE_CHAIN = (
+    "highpass=f=250,"
+    "equalizer=f=850:width_type=o:width=1:g=2,"
+    "equalizer=f=3000:width_type=o:width=1:g=4,"
+    "equalizer=f=6000:width_type=o:width=1:g=2,"
+    "compand=attacks=0.01:decays=0.1:points=-80/-80|-15/-15|0/-3:gain=0"
+)
+LOUDNORM = "loudnorm=I=-14:TP=-1.0:LRA=11"
+FILTER_CHAIN = PRE_CHAIN + "," + LOUDNORM
+
+def chain_hash(two_pass):
+    return hashlib.sha256(json.dumps([FILTER_CHAIN, two_pass, 44100]).encode()).hexdigest()
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: ignoring unreadable {path}")
+        return {}
+
+def save_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def measure(in_path):
+    # First loudnorm pass: analysis only, output discarded. loudnorm prints
+    # its stats as a JSON object on stderr.
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-nostdin", "-i", in_path,
+        "-filter:a", FILTER_CHAIN + ":print_format=json",
+        "-f", "null", "-"
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.decode("utf-8", "replace")
+    if proc.returncode:
+        return None, stderr
+    found = re.findall(r"\{[^{}]*\"input_i\"[^{}]*\}", stderr)
+    if not found:
+        return None, stderr
+    return json.loads(found[-1]), stderr
+
+def linear_loudnorm(stats):
+    # Second pass: apply one measured gain instead of dynamic normalization
+    return (
+        f"{LOUDNORM}:measured_I={stats['input_i']}:measured_TP={stats['input_tp']}"
+        f":measured_LRA={stats['input_lra']}:measured_thresh={stats['input_thresh']}"
+        f":offset={stats['target_offset']}:linear=true"
+    )
+
+def normalize_file(in_path, out_path, stats=None, two_pass=True):
+    # Runs in a pool thread; the work itself happens in the ffmpeg child.
+    # Encodes to a temp file and renames, so a failed run never leaves a
+    # truncated MP3 behind. In two-pass mode the first pass only runs when
+    # no cached stats were passed in.
+    # Returns (ok, seconds, stderr, stats).
+    t0 = time.perf_counter()
+    filter_chain = FILTER_CHAIN
+    if two_pass:
+        if stats is None:
+            stats, stderr = measure(in_path)
+            if stats is None:
+                return False, time.perf_counter() - t0, stderr, None
+        filter_chain = PRE_CHAIN + "," + linear_loudnorm(stats)
+
+    tmp_path = out_path + ".part"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-y", "-nostdin", "-i", in_path,
+        "-filter:a", filter_chain,
+        "-ar", "44100", # Ensure standard rate
+        "-f", "mp3", tmp_path
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - t0
+    stderr = proc.stderr.decode("utf-8", "replace")
+    if proc.returncode == 0:
+        os.replace(tmp_path, out_path)
+        return True, elapsed, stderr, stats
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return False, elapsed, stderr, stats
+
+def normalize_all(jobs=None, two_pass=True, force=False):
+    """Normalize every MP3 in AUDIO_DIR into TEMP_DIR; returns {filename: stderr} for failures."""
+    if not os.path.exists(TEMP_DIR):
+        os.makedirs(TEMP_DIR)
+
+    filenames = sorted(f for f in os.listdir(AUDIO_DIR) if f.endswith(".mp3"))
+    if not filenames:
+        print(f"No MP3s in {AUDIO_DIR}")
+        return {}
+
+    # An output is up to date when it exists and was made from the same
+    # input bytes with the same chain
+    chain = chain_hash(two_pass)
+    manifest = load_json(MANIFEST_FILE)
+    measurements = load_json(MEASURE_CACHE)
+    pending = {}
+    for name in filenames:
+        key = hashlib.sha256((file_sha256(os.path.join(AUDIO_DIR, name)) + chain).encode()).hexdigest()
+        if not force and manifest.get(name) == key and os.path.exists(os.path.join(TEMP_DIR, name)):
+            continue
+        pending[name] = key
+    skipped = len(filenames) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} unchanged files.")
+    if not pending:
+        return {}
+
+    # ffmpeg's filters here are single-threaded, so one job per core
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pending)))
+    cached = sum(1 for key in pending.values() if key in measurements) if two_pass else 0
+    print(f"Normalizing {len(pending)} files with {jobs} jobs"
+          + (f" (two-pass, {cached} measurements cached)..." if two_pass else "..."))
+
+    failures = {}
+    busy = 0.0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(normalize_file, os.path.join(AUDIO_DIR, name), os.path.join(TEMP_DIR, name),
+                        measurements.get(key), two_pass): name
+            for name, key in pending.items()
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            ok, elapsed, stderr, stats = future.result()
+            busy += elapsed
+            if two_pass and stats is not None:
+                measurements[pending[name]] = stats
+            if ok:
+                manifest[name] = pending[name]
+            else:
+                failures[name] = stderr
+            print(f"[{done}/{len(pending)}] {name}: {'ok' if ok else 'FAILED'} ({elapsed:.2f}s)")
+
+    if two_pass:
+        save_json(MEASURE_CACHE, measurements)
+    save_json(MANIFEST_FILE, manifest)
+
+    wall = time.perf_counter() - t0
+    print(f"Finished in {wall:.2f}s ({busy:.2f}s of ffmpeg time, {busy / wall if wall else 0:.1f}x), "
+          f"{len(pending) - len(failures)}/{len(pending)} ok")
+    for name, stderr in failures.items():
+        print(f"\n--- {name} ---")
+        print("\n".join(stderr.strip().splitlines()[-20:]) or "(no output)")
+    return failures
 
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
-
-for filename in os.listdir(AUDIO_DIR):
-    if filename.endswith(".mp3"):
-        in_path = os.path.join(AUDIO_DIR, filename)
-        out_path = os.path.join(TEMP_DIR, filename)
-        
-        # Expert DSP Chain:
-        # 1. HighPass @ 250Hz (Kill power-wasting bass)
-        # 2. EQ: +2dB @ 850Hz, +4dB @ 3kHz, +2dB @ 6kHz (Vocal Presence)
-        # 3. Compression (Control dynamics)
-        # 4. Loudness Normalization (Target -14 LUFS)
-        
-        filter_chain = (
-            "highpass=f=250,"
-            "equalizer=f=850:width_type=o:width=1:g=2,"
-            "equalizer=f=3000:width_type=o:width=1:g=4,"
-            "equalizer=f=6000:width_type=o:width=1:g=2,"
-            "compand=attacks=0.01:decays=0.1:points=-80/-80|-15/-15|0/-3:gain=0," 
-            "loudnorm=I=-14:TP=-1.0:LRA=11"
-        )
-
-        cmd = [
-            "ffmpeg", "-y", "-i", in_path,
-            "-filter:a", filter_chain,
-            "-ar", "44100", # Ensure standard rate
-            out_path
-        ]
-        
-        print(f"Processing {filename}...")
-        try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError:
-            print(f"Failed to normalize {filename}")
-
-print("Done. Normalized files in www/audio_norm")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Run the vocal DSP chain over {AUDIO_DIR}/*.mp3")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="concurrent ffmpeg processes (default: CPU count)")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="use loudnorm's dynamic single-pass mode instead of measure + linear")
+    parser.add_argument("--force", action="store_true",
+                        help="re-normalize files even if input and chain are unchanged")
+    args = parser.parse_args()
+    failures = normalize_all(jobs=args.jobs, two_pass=not args.single_pass, force=args.force)
+    if failures:
+        sys.exit(1)
+    print(f"Done. Normalized files in {TEMP_DIR}")
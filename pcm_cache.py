@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Decoded-PCM cache shared by generate_show_assets.py, process_audio.py and
+# transcribe_audio.py. A source is decoded by ffmpeg once into a raw PCM file
+# plus a small JSON sidecar, keyed by the source's content hash and the
+# requested output format. Later runs memory-map the raw file instead of
+# decoding the MP3 again.
+
+CACHE_DIR = ".pcm_cache"
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # evict least recently used entries past 2 GB
+
+# ffmpeg raw format -> numpy dtype
+FORMATS = {
+    "s16le": np.int16,
+    "f32le": np.float32,
+}
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class PCMAudio:
+    """Decoded audio backed by a read-only (copy-on-write) memory map."""
+
+    def __init__(self, source, samples, sample_rate, channels, fmt):
+        self.source = source
+        self.samples = samples  # shape (frames, channels)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.fmt = fmt
+
+    def __len__(self):
+        # Milliseconds, like AudioSegment
+        return round(1000 * len(self.samples) / self.sample_rate)
+
+    @property
+    def sample_width(self):
+        return self.samples.dtype.itemsize
+
+    def mono(self):
+        # 1-D view when the cache entry is already mono (e.g. whisper input)
+        if self.channels != 1:
+            raise ValueError(f"{self.source} has {self.channels} channels, not 1")
+        return self.samples.reshape(-1)
+
+    def to_audio_segment(self):
+        # pydub keeps its own bytes, so this is one memcpy - but no MP3 decode
+        from pydub import AudioSegment
+        if self.fmt != "s16le":
+            raise ValueError("AudioSegment needs integer PCM; load with fmt='s16le'")
+        return AudioSegment(self.samples.tobytes(), sample_width=self.sample_width,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+def probe(path):
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels", "-of", "json", path
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True).stdout
+    stream = json.loads(out)["streams"][0]
+    return int(stream["sample_rate"]), int(stream["channels"])
+
+def _entry_paths(key):
+    base = os.path.join(CACHE_DIR, key)
+    return base + ".pcm", base + ".json"
+
+def _decode(path, pcm_path, sample_rate, channels, fmt):
+    # Decode into a temp file next to the cache entry, then rename, so an
+    # interrupted decode never leaves a truncated entry behind.
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            cmd = [
+                "ffmpeg", "-v", "error", "-nostdin", "-i", path,
+                "-ar", str(sample_rate), "-ac", str(channels),
+                "-f", fmt, "-"
+            ]
+            subprocess.run(cmd, check=True, stdout=out, stderr=subprocess.PIPE)
+        os.replace(tmp_path, pcm_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def evict(max_bytes=MAX_CACHE_BYTES, keep=()):
+    # Drop least recently used entries until the cache fits in max_bytes.
+    # Access time is tracked through the sidecar's mtime (touched on hit).
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        pcm_path, meta_path = _entry_paths(key)
+        size = os.path.getsize(pcm_path) if os.path.exists(pcm_path) else 0
+        entries.append((os.path.getmtime(meta_path), key, size))
+        total += size
+
+    for _, key, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if key in keep:
+            continue
+        for p in _entry_paths(key):
+            if os.path.exists(p):
+                os.remove(p)
+        total -= size
+        print(f"PCM cache: evicted {key[:12]} ({size / 1024 / 1024:.1f} MB)")
+
+def load_pcm(path, sample_rate=None, channels=None, fmt="s16le", max_bytes=MAX_CACHE_BYTES):
+    """Return a PCMAudio for path, decoding it only on a cache miss.
+
+    sample_rate/channels default to the source's own; pass e.g. 16000/1 with
+    fmt="f32le" to get whisper-ready input.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported PCM format {fmt}")
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+    source_hash = file_sha256(path)
+    if sample_rate is None or channels is None:
+        src_rate, src_channels = probe(path)
+        sample_rate = sample_rate or src_rate
+        channels = channels or src_channels
+
+    key = f"{source_hash}_{sample_rate}_{channels}_{fmt}"
+    pcm_path, meta_path = _entry_paths(key)
+
+    if os.path.exists(pcm_path) and os.path.exists(meta_path):
+        os.utime(meta_path)
+    else:
+        print(f"PCM cache: decoding {os.path.basename(path)} ({sample_rate} Hz, {channels} ch, {fmt})...")
+        _decode(path, pcm_path, sample_rate, channels, fmt)
+        with open(meta_path, "w") as f:
+            json.dump({
+                "source": os.path.abspath(path),
+                "sha256": source_hash,
+                "sample_rate": sample_rate,
+                "channels": channels,
+                "format": fmt,
+            }, f, indent=2)
+        evict(max_bytes, keep={key})
+
+    dtype = FORMATS[fmt]
+    if os.path.getsize(pcm_path) == 0:
+        samples = np.zeros((0, channels), dtype=dtype)
+    else:
+        # mode "c": zero-copy, and writable for consumers (torch) that insist
+        samples = np.memmap(pcm_path, dtype=dtype, mode="c").reshape(-1, channels)
+    return PCMAudio(path, samples, sample_rate, channels, fmt)
+
+def load_audio_segment(path):
+    return load_pcm(path).to_audio_segment()
+
+def stream_pcm(path, sample_rate=None, channels=None, block_ms=500, fmt="s16le"):
+    """Yield decoded audio as (frames, channels) blocks straight from ffmpeg.
+
+    Nothing is cached and only one block is held at a time, so memory stays
+    flat however long the recording is.
+    """
+    if sample_rate is None or channels is None:
+        src_rate, src_channels = probe(path)
+        sample_rate = sample_rate or src_rate
+        channels = channels or src_channels
+
+    dtype = np.dtype(FORMATS[fmt])
+    frame_bytes = dtype.itemsize * channels
+    block_bytes = max(1, int(sample_rate * block_ms / 1000)) * frame_bytes
+
+    cmd = [
+        "ffmpeg", "-v", "error", "-nostdin", "-i", path,
+        "-ar", str(sample_rate), "-ac", str(channels),
+        "-f", fmt, "-"
+    ]
+    # stderr to a file, not a pipe: nobody reads it until stdout is done,
+    # and a full stderr pipe would block ffmpeg (and so us) mid-decode
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log)
+    try:
+        leftover = b""
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) - len(data) % frame_bytes
+            leftover = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=dtype).reshape(-1, channels)
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+        log.seek(0)
+        stderr = log.read()
+        log.close()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
@@ -1,91 +1,268 @@
 import os
+import argparse
 import json
+import time
+import wave
+import numpy as np
 import speech_recognition as sr
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
+from pcm_cache import file_sha256, load_pcm, stream_pcm
+from transcript_cache import TranscriptCache
+import vad
 
 # Configuration
 AUDIO_FILE = "Audio/ElevenLabs_2025-12-23T22_29_06_Flicker - Cheerful Fairy & Sparkly Sweetness_pvc_sp95_s0_sb100_v3.mp3"
 OUTPUT_JSON = "transcript_chunks.json"
+CHECKPOINT_FILE = "transcript_chunks.ckpt.jsonl"
 TEMP_DIR = "temp_chunks"
+RECOGNIZER = "google"
+MIN_SILENCE_LEN = 700
+SILENCE_OFFSET_DB = 14  # silence threshold relative to the recording's dBFS
 
-def process_audio():
+# Streaming mode (--stream): bounded memory, absolute threshold
+STREAM_SAMPLE_RATE = 16000
+STREAM_BLOCK_MS = 500
+STREAM_SILENCE_THRESH = -32  # roughly dBFS - 14 for the ElevenLabs take
+MAX_CHUNK_MS = 30000  # force a split in speech runs longer than this
+
+def benchmark_vad(sound, samples, frame_rate, silence_thresh, hysteresis_db):
+    from pydub.silence import detect_nonsilent
+
+    print("Benchmarking pydub detect_nonsilent...")
+    t0 = time.perf_counter()
+    reference = detect_nonsilent(sound, min_silence_len=MIN_SILENCE_LEN, silence_thresh=silence_thresh)
+    pydub_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ranges = vad.detect_nonsilent(samples, frame_rate, min_silence_len=MIN_SILENCE_LEN,
+                                  silence_thresh=silence_thresh)
+    numpy_time = time.perf_counter() - t0
+
+    print(f"pydub: {pydub_time:.2f}s  NumPy: {numpy_time:.3f}s  "
+          f"Speedup: {pydub_time / max(numpy_time, 1e-9):.0f}x  "
+          f"Ranges {'identical' if ranges == reference else 'DIFFER'}")
+    if hysteresis_db:
+        gated = vad.detect_nonsilent(samples, frame_rate, min_silence_len=MIN_SILENCE_LEN,
+                                     silence_thresh=silence_thresh, hysteresis_db=hysteresis_db)
+        print(f"{len(ranges)} ranges, {len(gated)} with {hysteresis_db} dB hysteresis")
+
+def mono_samples(pcm):
+    # What sr.AudioFile does to a stereo WAV (audioop.tomono(..., 1, 1)):
+    # sum the channels and clip. Mono sources come back as a view.
+    if pcm.channels == 1:
+        return pcm.samples.reshape(-1)
+    info = np.iinfo(pcm.samples.dtype)
+    mixed = pcm.samples.sum(axis=1, dtype=np.int64)
+    np.clip(mixed, info.min, info.max, out=mixed)
+    return mixed.astype(pcm.samples.dtype)
+
+def iter_chunks(pcm, mono, ranges, padding_ms=200):
+    # Yield (start_ms, end_ms, samples) per padded range; samples are views
+    # into the decoded buffer, nothing is copied or written to disk
+    duration = len(pcm)
+    per_ms = pcm.sample_rate / 1000.0
+    for start_i, end_i in ranges:
+        start_ms = max(0, start_i - padding_ms)
+        end_ms = min(duration, end_i + padding_ms)
+        yield start_ms, end_ms, mono[int(start_ms * per_ms):int(end_ms * per_ms)]
+
+def write_debug_wav(path, samples, sample_rate):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(samples.dtype.itemsize)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+
+def checkpoint_key(source_hash, start_ms, end_ms, sample_rate, mode, recognizer=RECOGNIZER):
+    # Sample rate and decode path (the normal and --stream runs feed the
+    # recognizer different audio for the same range) are part of the key
+    return f"{source_hash}:{start_ms}:{end_ms}:{sample_rate}:{mode}:{recognizer}"
+
+def load_checkpoint():
+    # One JSON record per finished chunk. A crash can leave a torn last line,
+    # so unreadable lines are skipped rather than failing the resume.
+    done = {}
+    if not os.path.exists(CHECKPOINT_FILE):
+        return done
+    with open(CHECKPOINT_FILE, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            done[record["key"]] = record
+    return done
+
+def append_checkpoint(f, record):
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def compact_checkpoint(records):
+    # Rewrite the log with only the current run's records
+    tmp_path = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def transcribe_chunks(chunks, sample_rate, source_hash, mode, debug_wav=False):
+    # Transcribe (start_ms, end_ms, samples) chunks in order, skipping any
+    # already in the checkpoint log. Returns (records, chunk count).
+    recognizer = sr.Recognizer()
+    cache = TranscriptCache()
+    options = {"sample_rate": sample_rate, "channels": 1, "mode": mode}
+    done = load_checkpoint()
+    keys = []
+    skipped = 0
+
+    with open(CHECKPOINT_FILE, "a") as ckpt:
+        for i, (start_ms, end_ms, samples) in enumerate(chunks):
+            # Resume: chunks whose (source, range, rate, mode, recognizer) key
+            # is already in the checkpoint log are skipped
+            key = checkpoint_key(source_hash, start_ms, end_ms, sample_rate, mode)
+            keys.append(key)
+            if key in done:
+                skipped += 1
+                continue
+
+            filename = None
+            if debug_wav:
+                filename = f"chunk_{i:03d}.wav"
+                write_debug_wav(os.path.join(TEMP_DIR, filename), samples, sample_rate)
+
+            # The checkpoint log is compacted to the current run's ranges; the
+            # result cache keeps every range, so runs with other VAD settings
+            # don't hit the API again for ranges already seen
+            text = cache.get(source_hash, start_ms, end_ms, "speech_recognition", RECOGNIZER, options)
+            if text is not None:
+                print(f"Chunk {i} (cached): {text or '[Unintelligible]'}")
+            else:
+                audio_data = sr.AudioData(memoryview(samples).cast("B"), sample_rate, samples.dtype.itemsize)
+
+                # Transcribe
+                text = ""
+                try:
+                    text = recognizer.recognize_google(audio_data)
+                    print(f"Chunk {i}: {text}")
+                except sr.UnknownValueError:
+                    print(f"Chunk {i}: [Unintelligible]")
+                except Exception as e:
+                    # Not checkpointed, so the next run retries it
+                    print(f"Chunk {i} Error: {e}")
+                    continue
+                cache.put(source_hash, start_ms, end_ms, "speech_recognition", RECOGNIZER, text, options)
+
+            record = {
+                "key": key,
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "text": text,
+                "filename": filename
+            }
+            append_checkpoint(ckpt, record)
+            done[key] = record
+
+    if skipped:
+        print(f"Skipped {skipped} chunks already in {CHECKPOINT_FILE}.")
+    cache.print_stats()
+    cache.close()
+    return [done[key] for key in keys if key in done], len(keys)
+
+def save_results(records, total):
+    results = [
+        {
+            "id": i,
+            "start_ms": record["start_ms"],
+            "end_ms": record["end_ms"],
+            "text": record["text"],
+            "filename": record["filename"]
+        }
+        for i, record in enumerate(records)
+    ]
+
+    with open(OUTPUT_JSON, "w") as f:
+        json.dump(results, f, indent=2)
+    compact_checkpoint(records)
+
+    missing = total - len(records)
+    if missing:
+        print(f"{missing} chunks failed; re-run to retry them.")
+    print(f"Saved {len(results)} segments to {OUTPUT_JSON}")
+
+def process_audio(hysteresis_db=0, benchmark=False, debug_wav=False):
     if not os.path.exists(AUDIO_FILE):
         print(f"File not found: {AUDIO_FILE}")
         return
 
     print("Loading audio...")
-    sound = AudioSegment.from_mp3(AUDIO_FILE)
-    
-    print("Splitting on silence (this may take a moment)...")
-    # Adjust silence threshold and length as needed
-    chunks = split_on_silence(
-        sound, 
-        min_silence_len=700, 
-        silence_thresh=sound.dBFS - 14,
-        keep_silence=200
-    )
-    
-    print(f"Found {len(chunks)} chunks.")
-    
-    if not os.path.exists(TEMP_DIR):
+    pcm = load_pcm(AUDIO_FILE)
+    silence_thresh = vad.dbfs(pcm.samples) - SILENCE_OFFSET_DB
+
+    if debug_wav and not os.path.exists(TEMP_DIR):
         os.makedirs(TEMP_DIR)
-        
-    recognizer = sr.Recognizer()
-    results = []
-    
-    current_time = 0
-    
-    # We need to calculate timing roughly since split_on_silence loses absolute position unless we track it manually
-    # Actually, split_on_silence DOES lose timing. pydub doesn't give it back easily.
-    # We might need to implement a custom splitter or iterate differently to keep time.
-    # For now, let's use a simpler approach: detect non-silent ranges manually to keep time.
-    
-    # Better approach: Use detect_nonsilent to get ranges, then extract.
-    from pydub.silence import detect_nonsilent
-    
+
+    if benchmark:
+        sound = pcm.to_audio_segment()
+        benchmark_vad(sound, pcm.samples, pcm.sample_rate, silence_thresh, hysteresis_db)
+
+    # One NumPy pass over the raw samples keeps absolute timing (which
+    # split_on_silence throws away) and gives the same ranges as pydub
     print("Detecting non-silent ranges...")
-    ranges = detect_nonsilent(
-        sound,
-        min_silence_len=700,
-        silence_thresh=sound.dBFS - 14
+    ranges = vad.detect_nonsilent(
+        pcm.samples,
+        pcm.sample_rate,
+        min_silence_len=MIN_SILENCE_LEN,
+        silence_thresh=silence_thresh,
+        hysteresis_db=hysteresis_db
     )
     
     print(f"Detected {len(ranges)} non-silent ranges.")
-    
-    for i, (start_i, end_i) in enumerate(ranges):
-        # Add padding
-        start_ms = max(0, start_i - 200)
-        end_ms = min(len(sound), end_i + 200)
-        
-        chunk = sound[start_ms:end_ms]
-        chunk_path = os.path.join(TEMP_DIR, f"chunk_{i:03d}.wav")
-        chunk.export(chunk_path, format="wav")
-        
-        # Transcribe
-        text = ""
-        try:
-            with sr.AudioFile(chunk_path) as source:
-                audio_data = recognizer.record(source)
-                text = recognizer.recognize_google(audio_data)
-                print(f"Chunk {i}: {text}")
-        except sr.UnknownValueError:
-            print(f"Chunk {i}: [Unintelligible]")
-        except Exception as e:
-            print(f"Chunk {i} Error: {e}")
-            
-        results.append({
-            "id": i,
-            "start_ms": start_ms,
-            "end_ms": end_ms,
-            "text": text,
-            "filename": f"chunk_{i:03d}.wav"
-        })
-        
-    with open(OUTPUT_JSON, "w") as f:
-        json.dump(results, f, indent=2)
-        
-    print(f"Saved {len(results)} segments to {OUTPUT_JSON}")
+
+    chunks = iter_chunks(pcm, mono_samples(pcm), ranges)
+    records, total = transcribe_chunks(chunks, pcm.sample_rate, file_sha256(AUDIO_FILE), "full", debug_wav)
+    save_results(records, total)
+
+def process_audio_streaming(silence_thresh=STREAM_SILENCE_THRESH, hysteresis_db=0, debug_wav=False):
+    # Decode through a pipe and transcribe each chunk as soon as the silence
+    # after it has been seen. The whole-file dBFS isn't known up front, so
+    # the threshold is absolute here.
+    if not os.path.exists(AUDIO_FILE):
+        print(f"File not found: {AUDIO_FILE}")
+        return
+
+    if debug_wav and not os.path.exists(TEMP_DIR):
+        os.makedirs(TEMP_DIR)
+
+    print(f"Streaming {AUDIO_FILE} (silence below {silence_thresh} dBFS)...")
+    blocks = stream_pcm(AUDIO_FILE, sample_rate=STREAM_SAMPLE_RATE, channels=1, block_ms=STREAM_BLOCK_MS)
+    chunks = vad.iter_stream_chunks(
+        blocks,
+        STREAM_SAMPLE_RATE,
+        1,
+        min_silence_len=MIN_SILENCE_LEN,
+        silence_thresh=silence_thresh,
+        hysteresis_db=hysteresis_db,
+        padding_ms=200,
+        max_chunk_ms=MAX_CHUNK_MS
+    )
+    records, total = transcribe_chunks(chunks, STREAM_SAMPLE_RATE, file_sha256(AUDIO_FILE), "stream", debug_wav)
+    save_results(records, total)
 
 if __name__ == "__main__":
-    process_audio()
+    parser = argparse.ArgumentParser(description="Split the recording on silence and transcribe each chunk")
+    parser.add_argument("--hysteresis-db", type=float, default=0,
+                        help="stay silent until a window rises this many dB above the threshold")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time the NumPy detector against pydub's detect_nonsilent")
+    parser.add_argument("--debug-wav", action="store_true",
+                        help=f"also write each chunk to {TEMP_DIR}/chunk_NNN.wav")
+    parser.add_argument("--stream", action="store_true",
+                        help="decode through a pipe and transcribe chunks as they are found (bounded memory)")
+    parser.add_argument("--silence-thresh", type=float, default=STREAM_SILENCE_THRESH,
+                        help="with --stream, absolute silence threshold in dBFS")
+    args = parser.parse_args()
+    if args.stream:
+        process_audio_streaming(silence_thresh=args.silence_thresh, hysteresis_db=args.hysteresis_db,
+                                debug_wav=args.debug_wav)
+    else:
+        process_audio(hysteresis_db=args.hysteresis_db, benchmark=args.benchmark, debug_wav=args.debug_wav)
@@ -0,0 +1,213 @@
+import json
+import os
+import struct
+import sys
+
+# Compact binary show timeline (show_sequence.bin) for the box firmware.
+#
+# Layout, all integers little-endian:
+#
+#   Fixed header (12 bytes)
+#     char[4]  magic "SHOW"
+#     u8       version (1)
+#     u8       box count
+#     u16      string count
+#     u32      total event count
+#   String table
+#     per string: u8 length, UTF-8 bytes
+#   Box table (12 bytes per box)
+#     u16      box name (string index)
+#     u16      reserved (0)
+#     u32      stream offset from start of file
+#     u32      event count
+#   Event streams, one per box, back to back
+#     per event: varint delta time (ms since previous event of this box,
+#                first event relative to 0), varint action, varint type,
+#                varint state (string indexes)
+#
+# A box reads the header, string table and box table, then seeks straight
+# to its own stream - it never has to parse the other boxes' events.
+# Dialogue text is not encoded; the firmware doesn't display it.
+
+MAGIC = b"SHOW"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHI")
+BOX_ENTRY = struct.Struct("<HHII")
+FIELDS = ("action", "type", "state")
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError(f"varint must be non-negative, got {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+def encode_sequence(events):
+    # Boxes and strings keep first-seen order so output is deterministic
+    boxes = {}
+    strings = {}
+
+    def intern(s):
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    for evt in events:
+        boxes.setdefault(evt["box"], []).append(evt)
+        intern(evt["box"])
+        for field in FIELDS:
+            intern(evt.get(field, ""))
+
+    if len(boxes) > 255 or len(strings) > 65535:
+        raise ValueError("Too many boxes or strings for show format v1")
+
+    streams = []
+    for box, box_events in boxes.items():
+        out = bytearray()
+        prev = 0
+        for evt in box_events:
+            if evt["time"] < prev:
+                raise ValueError(f"Events for {box} are not in time order at {evt['time']} ms")
+            _write_varint(out, evt["time"] - prev)
+            prev = evt["time"]
+            for field in FIELDS:
+                _write_varint(out, strings[evt.get(field, "")])
+        streams.append(bytes(out))
+
+    table = bytearray()
+    for s in strings:
+        raw = s.encode("utf-8")
+        if len(raw) > 255:
+            raise ValueError(f"String too long for show format: {s[:20]}...")
+        table.append(len(raw))
+        table += raw
+
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(boxes), len(strings), len(events)))
+    data += table
+    offset = len(data) + BOX_ENTRY.size * len(boxes)
+    for (box, box_events), stream in zip(boxes.items(), streams):
+        data += BOX_ENTRY.pack(strings[box], 0, offset, len(box_events))
+        offset += len(stream)
+    for stream in streams:
+        data += stream
+    return bytes(data)
+
+def read_index(data):
+    # Parse header, string table and box table.
+    # Returns (strings, {box: (offset, count)}, total event count).
+    magic, version, box_count, string_count, total = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a show timeline (bad magic)")
+    if version != VERSION:
+        raise ValueError(f"Unsupported show format version {version}")
+
+    pos = HEADER.size
+    strings = []
+    for _ in range(string_count):
+        length = data[pos]
+        strings.append(bytes(data[pos + 1:pos + 1 + length]).decode("utf-8"))
+        pos += 1 + length
+
+    boxes = {}
+    for _ in range(box_count):
+        name, _, offset, count = BOX_ENTRY.unpack_from(data, pos)
+        boxes[strings[name]] = (offset, count)
+        pos += BOX_ENTRY.size
+    return strings, boxes, total
+
+def decode_box(data, box, index=None):
+    strings, boxes, _ = index or read_index(data)
+    if box not in boxes:
+        return []
+    pos, count = boxes[box]
+    events = []
+    t = 0
+    for _ in range(count):
+        delta, pos = _read_varint(data, pos)
+        t += delta
+        evt = {"time": t, "box": box}
+        for field in FIELDS:
+            idx, pos = _read_varint(data, pos)
+            evt[field] = strings[idx]
+        events.append(evt)
+    return events
+
+def decode_sequence(data):
+    index = read_index(data)
+    events = []
+    for box in index[1]:
+        events.extend(decode_box(data, box, index))
+    events.sort(key=lambda e: e["time"])
+    return events
+
+def validate(events, data):
+    # Every box's decoded stream must match its JSON events field for field.
+    # Returns a list of problems (empty when the file round-trips).
+    problems = []
+    strings, boxes, total = read_index(data)
+    if total != len(events):
+        problems.append(f"event count {total} != {len(events)}")
+
+    expected = {}
+    for evt in events:
+        expected.setdefault(evt["box"], []).append(
+            {"time": evt["time"], "box": evt["box"], **{f: evt.get(f, "") for f in FIELDS}})
+
+    for box in set(expected) | set(boxes):
+        decoded = decode_box(data, box)
+        if decoded != expected.get(box, []):
+            problems.append(f"{box}: stream does not match JSON")
+    return problems
+
+def write_binary(events, path):
+    data = encode_sequence(events)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+def size_report(json_path, bin_path):
+    json_size = os.path.getsize(json_path)
+    bin_size = os.path.getsize(bin_path)
+    saved = 100 * (1 - bin_size / json_size) if json_size else 0
+    print(f"{os.path.basename(json_path)}: {json_size} bytes -> "
+          f"{os.path.basename(bin_path)}: {bin_size} bytes ({saved:.1f}% smaller)")
+
+if __name__ == "__main__":
+    # Usage: python show_format.py [show_sequence.json] [show_sequence.bin]
+    # Encodes the JSON if the .bin is missing, then validates the round trip.
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "www/show_sequence.json"
+    bin_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_path)[0] + ".bin"
+
+    with open(json_path, "r") as f:
+        events = json.load(f)
+
+    if not os.path.exists(bin_path):
+        print(f"Encoding {bin_path}...")
+        write_binary(events, bin_path)
+
+    with open(bin_path, "rb") as f:
+        data = f.read()
+
+    problems = validate(events, data)
+    for p in problems:
+        print(f"Mismatch: {p}")
+    size_report(json_path, bin_path)
+    if problems:
+        sys.exit(1)
+    print("Round trip OK")
@@ -0,0 +1,126 @@
+import json
+from bisect import bisect_left, bisect_right
+
+# Seekable view of the show sequence. Events are kept in one time-sorted
+# array and each box's speaking spans in sorted start/end arrays, so seeking
+# to an arbitrary offset is a handful of bisects instead of replaying every
+# lighting event. to_index() exports the same structure for
+# ShowTimeline in www/js/sequencer.js.
+
+INDEX_VERSION = 1
+
+class ShowTimeline:
+    def __init__(self, events):
+        # Stable sort keeps "off" before "on" where the source had it
+        self.events = sorted(events, key=lambda e: e["time"])
+        self.times = [e["time"] for e in self.events]
+
+        # Pair on/off per box into speaking spans, then union overlaps. A
+        # box can be switched on again before it is off (overlapping lines),
+        # so count nesting: a span opens on 0 -> 1 and closes on 1 -> 0
+        spans = {}
+        open_at = {}
+        depth = {}
+        for evt in self.events:
+            if evt.get("type", "speaking") != "speaking":
+                continue
+            box = evt["box"]
+            if evt["state"] == "on":
+                depth[box] = depth.get(box, 0) + 1
+                if depth[box] == 1:
+                    open_at[box] = evt["time"]
+            elif depth.get(box, 0) > 0:
+                depth[box] -= 1
+                if depth[box] == 0:
+                    spans.setdefault(box, []).append((open_at.pop(box), evt["time"]))
+        for box, start in open_at.items():
+            print(f"Warning: {box} switched on at {start} ms and never off")
+            spans.setdefault(box, []).append((start, float("inf")))
+
+        self.starts = {}
+        self.ends = {}
+        for box, box_spans in spans.items():
+            merged = []
+            for start, end in sorted(box_spans):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[box] = [s for s, _ in merged]
+            self.ends[box] = [e for _, e in merged]
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_segments(cls, segments):
+        # parse_transcript() output: [{"start", "end", "box", "text"}, ...]
+        events = []
+        for seg in segments:
+            events.append({"time": seg["start"], "box": seg["box"], "action": "anim",
+                           "type": "speaking", "state": "on"})
+            events.append({"time": seg["end"], "box": seg["box"], "action": "anim",
+                           "type": "speaking", "state": "off"})
+        return cls(events)
+
+    @property
+    def boxes(self):
+        return list(self.starts)
+
+    @property
+    def duration(self):
+        return self.times[-1] if self.times else 0
+
+    def is_active(self, box, t):
+        starts = self.starts.get(box)
+        if not starts:
+            return False
+        i = bisect_right(starts, t) - 1
+        return i >= 0 and t < self.ends[box][i]
+
+    def active_boxes(self, t):
+        """Boxes that are speaking at time t (ms)."""
+        return [box for box in self.starts if self.is_active(box, t)]
+
+    def next_events(self, t, n=1):
+        """The next n events strictly after time t."""
+        i = bisect_right(self.times, t)
+        return self.events[i:i + n]
+
+    def window(self, a, b):
+        """Events with a <= time < b."""
+        return self.events[bisect_left(self.times, a):bisect_left(self.times, b)]
+
+    def index_at(self, t):
+        # Index of the first event after t: where a player resumes from
+        return bisect_right(self.times, t)
+
+    def to_index(self):
+        def finite(values):
+            return [v if v != float("inf") else None for v in values]
+
+        return {
+            "version": INDEX_VERSION,
+            "times": self.times,
+            "events": self.events,
+            "boxes": {box: {"starts": self.starts[box], "ends": finite(self.ends[box])}
+                      for box in self.starts},
+        }
+
+    def write_index(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_index(), f, separators=(",", ":"))
+
+if __name__ == "__main__":
+    import sys
+
+    timeline = ShowTimeline.from_json(sys.argv[1] if len(sys.argv) > 1 else "www/show_sequence.json")
+    if len(sys.argv) > 2:
+        t = int(sys.argv[2])
+        print(f"Active at {t} ms: {', '.join(timeline.active_boxes(t)) or 'none'}")
+        for evt in timeline.next_events(t, 5):
+            print(f"  next: {evt['time']} ms {evt['box']} {evt['state']}")
+    else:
+        print(f"{len(timeline.events)} events, boxes: {', '.join(timeline.boxes)}")
@@ -1,30 +1,108 @@
-import whisper
+import argparse
 import json
 import os
+import time
+import whisper_worker
+import whisper_parallel
+from pcm_cache import file_sha256
+from transcript_cache import TranscriptCache
 
 AUDIO_FILE = "Audio/ElevenLabs_2025-12-23T22_29_06_Flicker - Cheerful Fairy & Sparkly Sweetness_pvc_sp95_s0_sb100_v3.mp3"
 OUTPUT_FILE = "transcript.json"
+BATCH_OUTPUT_DIR = "transcripts"
+MODEL_NAME = "base" # Use base model for speed/accuracy trade-off
 
-def transcribe():
+def transcribe_batch(workers=None):
+    paths = whisper_parallel.batch_files()
+    if not paths:
+        print("No MP3s found to transcribe.")
+        return
+
+    t0 = time.perf_counter()
+    cache = TranscriptCache()
+    results = whisper_parallel.transcribe_batch(paths, MODEL_NAME, workers=workers, cache=cache)
+
+    if not os.path.exists(BATCH_OUTPUT_DIR):
+        os.makedirs(BATCH_OUTPUT_DIR)
+    for path, segments in results.items():
+        out_path = os.path.join(BATCH_OUTPUT_DIR, os.path.splitext(os.path.basename(path))[0] + ".json")
+        with open(out_path, "w") as f:
+            json.dump(segments, f, indent=2)
+        print(f"{path}: {len(segments)} segments -> {out_path}")
+    print(f"Batch complete in {time.perf_counter() - t0:.2f}s")
+    cache.print_stats()
+    cache.close()
+
+def transcribe(in_process=False, workers=None, gated=False):
     if not os.path.exists(AUDIO_FILE):
         print(f"Error: Audio file not found at {AUDIO_FILE}")
         return
 
-    print("Loading model...")
-    model = whisper.load_model("base") # Use base model for speed/accuracy trade-off
-    
     print(f"Transcribing {AUDIO_FILE}...")
-    result = model.transcribe(AUDIO_FILE)
-    
+    t0 = time.perf_counter()
+
+    # Whole-file results are cached under the full range (end -1); windowed
+    # and gated runs cache per window or region inside whisper_parallel
+    cache = TranscriptCache()
+    audio_hash = file_sha256(AUDIO_FILE)
+
+    # Prefer the resident worker (model already loaded); whisper itself is
+    # only imported when we have to run in-process
+    segments = None
+    if gated:
+        segments = whisper_parallel.transcribe_gated(AUDIO_FILE, MODEL_NAME, workers=workers, cache=cache)
+    elif workers:
+        segments = whisper_parallel.transcribe_parallel(AUDIO_FILE, MODEL_NAME, workers=workers, cache=cache)
+    else:
+        segments = cache.get(audio_hash, 0, -1, "whisper", MODEL_NAME)
+        if segments is not None:
+            print("Using cached transcription.")
+    cached = segments is not None
+
+    if segments is None and not in_process:
+        segments = whisper_worker.transcribe_remote(AUDIO_FILE, MODEL_NAME)
+        if segments is None:
+            print("No whisper worker running, transcribing in-process...")
+
+    if segments is None:
+        # Decoded once into the shared PCM cache, then memory-mapped as
+        # whisper's 16 kHz mono float input instead of re-running ffmpeg
+        segments = whisper_worker.run_job({
+            "audio": whisper_worker.load_audio(AUDIO_FILE),
+            "model": MODEL_NAME,
+        })
+
+    if not cached:
+        cache.put(audio_hash, 0, -1, "whisper", MODEL_NAME, segments)
+
     # Save detailed segments
     with open(OUTPUT_FILE, "w") as f:
-        json.dump(result["segments"], f, indent=2)
-    
-    print(f"Transcription complete. Saved to {OUTPUT_FILE}")
-    
+        json.dump(segments, f, indent=2)
+
+    print(f"Transcription complete in {time.perf_counter() - t0:.2f}s. Saved to {OUTPUT_FILE}")
+    cache.print_stats()
+    cache.close()
+
     # Print for immediate view
-    for segment in result["segments"]:
+    for segment in segments:
         print(f"[{segment['start']:.2f} - {segment['end']:.2f}] {segment['text']}")
 
 if __name__ == "__main__":
-    transcribe()
+    parser = argparse.ArgumentParser(description="Transcribe the ElevenLabs take with whisper")
+    parser.add_argument("--in-process", action="store_true",
+                        help="don't use a running whisper_worker.py, load the model here")
+    parser.add_argument("--parallel", type=int, metavar="N", default=None,
+                        help="split into overlapping windows and transcribe on N worker processes")
+    parser.add_argument("--batch", action="store_true",
+                        help=f"transcribe every MP3 in {' and '.join(whisper_parallel.BATCH_DIRS)} into {BATCH_OUTPUT_DIR}/")
+    parser.add_argument("--gated", action="store_true",
+                        help="detect silence first and only transcribe the speech regions")
+    parser.add_argument("--scaling", action="store_true",
+                        help="benchmark --parallel from 1 to N workers (default: CPU count)")
+    args = parser.parse_args()
+    if args.scaling:
+        whisper_parallel.scaling_benchmark(AUDIO_FILE, MODEL_NAME, max_workers=args.parallel)
+    elif args.batch:
+        transcribe_batch(workers=args.parallel)
+    else:
+        transcribe(in_process=args.in_process, workers=args.parallel, gated=args.gated)
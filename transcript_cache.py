@@ -0,0 +1,74 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+# Persistent ASR result cache shared by transcribe_audio.py and
+# process_audio.py. Results are keyed by (audio content hash, time range,
+# engine, model, options) and stored zlib-compressed in a single SQLite
+# index, so a rerun on unchanged audio skips whisper / speech_recognition
+# entirely. Least recently used results are evicted past MAX_CACHE_BYTES.
+
+CACHE_PATH = ".transcript_cache.sqlite"
+MAX_CACHE_BYTES = 64 * 1024 ** 2
+
+def make_key(audio_hash, start_ms, end_ms, engine, model, options=None):
+    raw = json.dumps([audio_hash, start_ms, end_ms, engine, model, options or {}], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class TranscriptCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " audio_hash TEXT, start_ms INTEGER, end_ms INTEGER,"
+            " engine TEXT, model TEXT,"
+            " data BLOB, size INTEGER, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)")
+
+    def get(self, audio_hash, start_ms, end_ms, engine, model, options=None):
+        key = make_key(audio_hash, start_ms, end_ms, engine, model, options)
+        row = self.db.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, audio_hash, start_ms, end_ms, engine, model, result, options=None):
+        key = make_key(audio_hash, start_ms, end_ms, engine, model, options)
+        data = zlib.compress(json.dumps(result, separators=(",", ":")).encode("utf-8"), 9)
+        self.db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, audio_hash, start_ms, end_ms, engine, model, data, len(data), time.time())
+        )
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        print(f"Transcript cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+              f"{entries} entries, {size / 1024:.1f} KB")
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,296 @@
+import math
+
+import numpy as np
+
+# NumPy silence / voice-activity detection on raw sample arrays.
+#
+# detect_silence()/detect_nonsilent() reproduce pydub.silence exactly (same
+# millisecond slicing, same integer RMS, same range merging) but compute
+# every window's energy from one cumulative sum instead of slicing an
+# AudioSegment per millisecond. samples is an integer array shaped
+# (frames, channels) or (frames,), e.g. PCMAudio.samples.
+
+def max_possible_amplitude(samples):
+    return float(2 ** (samples.dtype.itemsize * 8 - 1))
+
+def _frames(samples):
+    return samples if samples.ndim == 2 else samples.reshape(-1, 1)
+
+def length_ms(samples, frame_rate):
+    return round(1000 * (len(samples) / frame_rate))
+
+def dbfs(samples):
+    # Whole-buffer loudness, like AudioSegment.dBFS
+    if samples.size == 0:
+        return -float("infinity")
+    sum_squares = np.dot(samples.reshape(-1).astype(np.float64), samples.reshape(-1).astype(np.float64))
+    rms = math.floor(math.sqrt(sum_squares / samples.size))
+    if not rms:
+        return -float("infinity")
+    return 20 * math.log10(rms / max_possible_amplitude(samples))
+
+def window_rms(samples, frame_rate, window_ms, starts_ms):
+    # Integer RMS (as audioop.rms) of samples[start:start + window_ms] for
+    # every start in starts_ms, all from one prefix sum of squared samples.
+    frames = _frames(samples)
+    channels = frames.shape[1]
+
+    energy = np.einsum("ij,ij->i", frames, frames, dtype=np.int64)
+    prefix = np.zeros(len(energy) + 1, dtype=np.int64)
+    np.cumsum(energy, out=prefix[1:])
+
+    # Same ms -> frame rounding as AudioSegment slicing
+    starts_ms = np.asarray(starts_ms, dtype=np.int64)
+    per_ms = frame_rate / 1000.0
+    a = (starts_ms * per_ms).astype(np.int64)
+    b = ((starts_ms + window_ms) * per_ms).astype(np.int64)
+
+    # Slices running past the data are padded with silence by pydub, so the
+    # padding still counts towards the sample count
+    n = (b - a) * channels
+    total = prefix[np.minimum(b, len(energy))] - prefix[np.minimum(a, len(energy))]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rms = np.floor(np.sqrt(total.astype(np.float64) / n))
+    rms[n == 0] = 0
+    return rms
+
+def detect_silence(samples, frame_rate, min_silence_len=1000, silence_thresh=-16,
+                   seek_step=1, hysteresis_db=0):
+    """Silent [start, end] ranges in ms, matching pydub.silence.detect_silence.
+
+    hysteresis_db > 0 makes windows sticky: once a window drops to
+    silence_thresh, following windows stay silent until they rise above
+    silence_thresh + hysteresis_db. This stops breaths and room noise
+    hovering around the threshold from chopping a pause into pieces.
+    """
+    seg_len = length_ms(samples, frame_rate)
+
+    # you can't have a silent portion of a sound that is longer than the sound
+    if seg_len < min_silence_len:
+        return []
+
+    max_amp = max_possible_amplitude(samples)
+    low = 10 ** (silence_thresh / 20) * max_amp
+
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+
+    rms = window_rms(samples, frame_rate, min_silence_len, slice_starts)
+    silent = rms <= low
+
+    if hysteresis_db:
+        high = 10 ** ((silence_thresh + hysteresis_db) / 20) * max_amp
+        loud = rms > high
+        # Forward-fill the last decisive window; undecided windows before
+        # the first decision count as sound
+        decided = np.where(silent | loud, np.arange(len(rms)), -1)
+        np.maximum.accumulate(decided, out=decided)
+        silent = np.where(decided >= 0, silent[np.maximum(decided, 0)], False)
+
+    silence_starts = slice_starts[silent]
+    if not len(silence_starts):
+        return []
+
+    # combine the silence we detected into ranges (start ms - end ms), the
+    # same way pydub does: a new range starts only where the starts are
+    # neither continuous nor overlapping
+    gaps = np.diff(silence_starts)
+    breaks = np.nonzero((gaps != seek_step) & (gaps > min_silence_len))[0]
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(s), int(e)] for s, e in zip(range_starts, range_ends)]
+
+def detect_nonsilent(samples, frame_rate, min_silence_len=1000, silence_thresh=-16,
+                     seek_step=1, hysteresis_db=0):
+    """Non-silent [start, end] ranges in ms, matching pydub.silence.detect_nonsilent."""
+    silent_ranges = detect_silence(samples, frame_rate, min_silence_len, silence_thresh,
+                                   seek_step, hysteresis_db)
+    len_seg = length_ms(samples, frame_rate)
+
+    # if there is no silence, the whole thing is nonsilent
+    if not silent_ranges:
+        return [[0, len_seg]]
+
+    # short circuit when the whole audio segment is silent
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end_i = 0
+    nonsilent_ranges = []
+    for start_i, end_i in silent_ranges:
+        nonsilent_ranges.append([prev_end_i, start_i])
+        prev_end_i = end_i
+
+    if end_i != len_seg:
+        nonsilent_ranges.append([prev_end_i, len_seg])
+
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+
+    return nonsilent_ranges
+
+class StreamingChunker:
+    """Incremental silence detection over PCM blocks from a decoder pipe.
+
+    Feed (frames, channels) blocks in order; feed() and finish() return the
+    non-silent chunks that are complete so far as (start_ms, end_ms, samples),
+    with samples padded by padding_ms on each side. Ranges are the same as
+    detect_nonsilent() (seek_step 1) on the whole recording. Only window
+    energies and the audio of the chunk in progress are kept, so memory is
+    bounded by the longest speech run; max_chunk_ms force-splits runs longer
+    than that.
+    """
+
+    def __init__(self, frame_rate, channels, min_silence_len=1000, silence_thresh=-16,
+                 hysteresis_db=0, padding_ms=0, max_chunk_ms=None, dtype=np.int16):
+        self.frame_rate = frame_rate
+        self.per_ms = frame_rate / 1000.0
+        self.channels = channels
+        self.min_len = min_silence_len
+        self.padding_ms = padding_ms
+        self.max_chunk_ms = max_chunk_ms
+
+        max_amp = float(2 ** (np.dtype(dtype).itemsize * 8 - 1))
+        self.low = 10 ** (silence_thresh / 20) * max_amp
+        self.high = 10 ** ((silence_thresh + hysteresis_db) / 20) * max_amp if hysteresis_db else None
+        self.silent_state = False
+
+        self.frames = 0           # frames fed so far
+        self.energy_total = 0     # sum of squares of every frame fed so far
+        self.buckets = 0          # completed 1 ms buckets
+        self.bucket_start_energy = 0
+        self.recent = []          # energies of the last min_len - 1 buckets
+        self.window = 0           # next window start (ms) to evaluate
+
+        self.prev_i = None        # last silent window start
+        self.last_end = 0         # end of the current/last silent range
+        self.cut = 0              # start of the pending chunk after a forced split
+
+        self.pending = []         # ranges waiting for their trailing padding
+        self.buf = np.zeros((0, channels), dtype=dtype)
+        self.buf_start = 0        # frame index of buf[0]
+
+    def _frame(self, ms):
+        return int(ms * self.per_ms)
+
+    def _window_frames(self, starts):
+        starts = np.asarray(starts, dtype=np.int64)
+        return ((starts + self.min_len) * self.per_ms).astype(np.int64) - (starts * self.per_ms).astype(np.int64)
+
+    def _chunk(self, start_ms, end_ms, limit_ms):
+        start_ms = max(0, start_ms - self.padding_ms)
+        end_ms = min(end_ms + self.padding_ms, limit_ms)
+        a = max(self._frame(start_ms) - self.buf_start, 0)
+        b = self._frame(end_ms) - self.buf_start
+        return start_ms, end_ms, self.buf[a:b].copy()
+
+    def _decide(self, i, rms, out):
+        if rms <= self.low:
+            self.silent_state = True
+        elif self.high is None or rms > self.high:
+            self.silent_state = False
+
+        if self.silent_state:
+            # Same merging rule as pydub: a new silent range starts only
+            # where the window starts are neither continuous nor overlapping
+            if self.prev_i is None or (i != self.prev_i + 1 and i > self.prev_i + self.min_len):
+                start = max(self.last_end, self.cut)
+                if i > start:
+                    out.append((start, i))
+            self.prev_i = i
+            self.last_end = i + self.min_len
+        elif self.max_chunk_ms and (self.prev_i is None or i > self.prev_i + self.min_len):
+            start = max(self.last_end, self.cut)
+            if i - start > self.max_chunk_ms:
+                out.append((start, i))
+                self.cut = i
+
+    def _trim(self):
+        keep_from_ms = max(self.last_end, self.cut)
+        if self.pending:
+            keep_from_ms = min(keep_from_ms, self.pending[0][0])
+        keep_from = self._frame(max(0, keep_from_ms - self.padding_ms))
+        drop = min(keep_from - self.buf_start, len(self.buf))
+        if drop > 0:
+            self.buf = self.buf[drop:]
+            self.buf_start += drop
+
+    def feed(self, block):
+        block = block.reshape(-1, self.channels)
+        f0 = self.frames
+        f1 = f0 + len(block)
+        self.buf = np.concatenate((self.buf, block))
+
+        prefix = np.zeros(len(block) + 1, dtype=np.int64)
+        np.cumsum(np.einsum("ij,ij->i", block, block, dtype=np.int64), out=prefix[1:])
+
+        # Buckets completed by this block, with pydub's ms -> frame rounding
+        k = int(f1 / self.per_ms) + 1
+        while self._frame(k) > f1:
+            k -= 1
+        ranges = self.pending
+        if k > self.buckets:
+            bounds = (np.arange(self.buckets + 1, k + 1) * self.per_ms).astype(np.int64)
+            cum = np.concatenate(([self.bucket_start_energy], self.energy_total + prefix[bounds - f0]))
+            energies = np.diff(cum)
+            self.bucket_start_energy = int(cum[-1])
+            self.buckets = k
+
+            # Windows ending in the new buckets: i = bucket - min_len + 1
+            history = np.concatenate((np.asarray(self.recent, dtype=np.int64), energies))
+            cum = np.concatenate(([0], np.cumsum(history)))
+            sums = cum[self.min_len:] - cum[:-self.min_len]
+            starts = np.arange(self.buckets - len(sums) - self.min_len + 1, self.buckets - self.min_len + 1)
+            n = self._window_frames(starts) * self.channels
+            rms = np.floor(np.sqrt(sums / n)) if len(sums) else sums
+            for i, r in zip(starts.tolist(), rms.tolist()):
+                if i >= self.window:
+                    self._decide(i, r, ranges)
+            self.window = max(self.window, int(starts[-1]) + 1 if len(starts) else self.window)
+            self.recent = history[-(self.min_len - 1):].tolist() if self.min_len > 1 else []
+
+        self.energy_total += int(prefix[-1])
+        self.frames = f1
+
+        # Emit ranges once their trailing padding has been decoded
+        chunks = []
+        while self.pending and self._frame(self.pending[0][1] + self.padding_ms) <= self.frames:
+            start, end = self.pending.pop(0)
+            chunks.append(self._chunk(start, end, end + self.padding_ms))
+        self._trim()
+        return chunks
+
+    def finish(self):
+        seg_len = round(1000 * (self.frames / self.frame_rate))
+        ranges = self.pending
+
+        # Trailing windows run past the data; pydub pads them with silence
+        last_slice_start = seg_len - self.min_len
+        partial = self.energy_total - self.bucket_start_energy
+        for i in range(self.window, last_slice_start + 1):
+            energy = sum(self.recent[len(self.recent) - (self.buckets - i):]) + partial
+            n = int(self._window_frames([i])[0]) * self.channels
+            self._decide(i, np.floor(np.sqrt(energy / n)) if n else 0, ranges)
+        self.window = max(self.window, last_slice_start + 1)
+
+        if self.prev_i is None:
+            start = self.cut
+            if seg_len > start:
+                ranges.append((start, seg_len))
+        elif self.last_end != seg_len:
+            ranges.append((max(self.last_end, self.cut), seg_len))
+
+        self.pending = []
+        return [self._chunk(s, e, seg_len) for s, e in ranges]
+
+def iter_stream_chunks(blocks, frame_rate, channels, **kwargs):
+    # Generator over (start_ms, end_ms, samples) as the decoder produces blocks
+    chunker = None
+    for block in blocks:
+        if chunker is None:
+            chunker = StreamingChunker(frame_rate, channels, dtype=block.dtype, **kwargs)
+        yield from chunker.feed(block)
+    if chunker is not None:
+        yield from chunker.finish()
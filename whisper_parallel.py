@@ -0,0 +1,215 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import vad
+from pcm_cache import file_sha256
+from whisper_worker import SAMPLE_RATE, load_audio
+
+# Multi-core whisper: long audio is cut into overlapping windows that are
+# transcribed across a process pool, then stitched back together. Each
+# worker process loads the model once. Audio comes from the shared PCM
+# cache, so every worker maps the same decoded file instead of decoding it.
+#
+# Stitching: each window owns the time between the midpoints of its
+# overlaps with its neighbours. A word is kept only by the window that owns
+# its midpoint, which drops the duplicated words in every overlap, and word
+# times are clamped so they never run backwards.
+
+WINDOW_S = 30.0
+OVERLAP_S = 4.0
+BATCH_DIRS = ["Audio", "www/audio"]
+
+# Gated mode: only the speech regions found by vad go to whisper. Same
+# detector settings as process_audio.py, plus padding so word onsets and
+# tails aren't clipped.
+GATE_MIN_SILENCE_MS = 700
+GATE_OFFSET_DB = 14
+GATE_PADDING_MS = 300
+
+_model = None
+
+def _init_worker(model_name, threads):
+    global _model
+    import torch
+    import whisper
+    # Keep N workers x torch threads within the core count
+    torch.set_num_threads(threads)
+    _model = whisper.load_model(model_name)
+
+def split_windows(n_samples, window_s=WINDOW_S, overlap_s=OVERLAP_S):
+    window = int(window_s * SAMPLE_RATE)
+    step = window - int(overlap_s * SAMPLE_RATE)
+    if step <= 0:
+        raise ValueError("Overlap must be shorter than the window")
+    windows = []
+    start = 0
+    while True:
+        end = min(start + window, n_samples)
+        windows.append((start, end))
+        if end >= n_samples:
+            return windows
+        start += step
+
+def _transcribe_window(path, start, end, options):
+    audio = load_audio(path)[start:end]
+    result = _model.transcribe(audio, word_timestamps=True, condition_on_previous_text=False, **options)
+    offset = start / SAMPLE_RATE
+    segments = []
+    for seg in result["segments"]:
+        words = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in seg.get("words", [])]
+        segments.append(dict(seg, start=seg["start"] + offset, end=seg["end"] + offset, words=words))
+    return segments
+
+def stitch(windows, results):
+    """Merge per-window segments into one monotonic, de-duplicated list."""
+    bounds = []
+    for i, (start, end) in enumerate(windows):
+        lo = 0.0 if i == 0 else (start + windows[i - 1][1]) / 2 / SAMPLE_RATE
+        hi = float("inf") if i == len(windows) - 1 else (windows[i + 1][0] + end) / 2 / SAMPLE_RATE
+        bounds.append((lo, hi))
+
+    stitched = []
+    last_end = 0.0
+    for (lo, hi), segments in zip(bounds, results):
+        for seg in segments:
+            words = []
+            for w in seg["words"]:
+                mid = (w["start"] + w["end"]) / 2
+                if not lo <= mid < hi:
+                    continue
+                start = max(w["start"], last_end)
+                end = max(w["end"], start)
+                words.append(dict(w, start=start, end=end))
+                last_end = end
+            if not words:
+                continue
+            stitched.append(dict(
+                seg,
+                id=len(stitched),
+                start=words[0]["start"],
+                end=words[-1]["end"],
+                text="".join(w["word"] for w in words),
+                words=words,
+            ))
+    return stitched
+
+def _pool(model_name, workers):
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(model_name, threads))
+
+def _window_ms(start, end):
+    return start * 1000 // SAMPLE_RATE, end * 1000 // SAMPLE_RATE
+
+def _run_windows(jobs, model_name, workers, options, cache):
+    # jobs: {path: [(start, end), ...]} in samples. Returns {path: [segments
+    # per window]}. With a TranscriptCache, windows already transcribed with
+    # the same model and options are taken from it and only the rest go to
+    # the pool.
+    cache_options = dict(options, word_timestamps=True, window=True)
+    hashes = {}
+    results = {}
+    for path, windows in jobs.items():
+        results[path] = [None] * len(windows)
+        if cache is not None:
+            hashes[path] = file_sha256(path)
+            for i, (s, e) in enumerate(windows):
+                results[path][i] = cache.get(hashes[path], *_window_ms(s, e), "whisper", model_name, cache_options)
+
+    todo = [(path, i) for path in jobs for i, r in enumerate(results[path]) if r is None]
+    total = sum(len(w) for w in jobs.values())
+    if not todo:
+        # Pool start-up loads the model in every worker, so skip it entirely
+        # when everything came from the cache
+        print(f"All {total} windows cached.")
+        return results
+
+    workers = min(workers, len(todo))
+    print(f"Transcribing {len(jobs)} file(s): {len(todo)} of {total} windows on {workers} workers...")
+    with _pool(model_name, workers) as pool:
+        futures = [(path, i, pool.submit(_transcribe_window, path, *jobs[path][i], options))
+                   for path, i in todo]
+        for path, i, future in futures:
+            results[path][i] = future.result()
+            if cache is not None:
+                cache.put(hashes[path], *_window_ms(*jobs[path][i]), "whisper", model_name,
+                          results[path][i], cache_options)
+    return results
+
+def transcribe_batch(paths, model_name="base", workers=None, options=None, cache=None):
+    """Transcribe several files in one pool; returns {path: segments}."""
+    workers = workers or os.cpu_count() or 1
+    jobs = {path: split_windows(len(load_audio(path))) for path in paths}
+    results = _run_windows(jobs, model_name, workers, options or {}, cache)
+    return {path: stitch(jobs[path], results[path]) for path in paths}
+
+def transcribe_parallel(path, model_name="base", workers=None, options=None, cache=None):
+    return transcribe_batch([path], model_name, workers, options, cache)[path]
+
+def speech_regions(audio, min_silence_len=GATE_MIN_SILENCE_MS, offset_db=GATE_OFFSET_DB,
+                   padding_ms=GATE_PADDING_MS):
+    """Padded, merged (start, end) sample ranges of speech in 16 kHz audio."""
+    # The detector works on integer PCM like pydub; one int16 copy of the
+    # float input is much cheaper than a second decode
+    pcm = (np.clip(audio, -1.0, 32767 / 32768) * 32768).astype(np.int16)
+    ranges = vad.detect_nonsilent(pcm, SAMPLE_RATE, min_silence_len=min_silence_len,
+                                  silence_thresh=vad.dbfs(pcm) - offset_db)
+    pad = padding_ms * SAMPLE_RATE // 1000
+    regions = []
+    for start_ms, end_ms in ranges:
+        start = max(0, start_ms * SAMPLE_RATE // 1000 - pad)
+        end = min(len(audio), end_ms * SAMPLE_RATE // 1000 + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+        else:
+            regions.append((start, end))
+    return regions
+
+def transcribe_gated(path, model_name="base", workers=None, options=None, cache=None):
+    """Transcribe only the speech regions of path, with absolute timestamps."""
+    workers = workers or os.cpu_count() or 1
+    audio = load_audio(path)
+    regions = speech_regions(audio)
+    speech = sum(end - start for start, end in regions)
+    total = max(len(audio), 1)
+    print(f"Gated: {len(regions)} speech regions, {speech / SAMPLE_RATE:.1f}s of {total / SAMPLE_RATE:.1f}s "
+          f"({100 * (1 - speech / total):.0f}% of the audio skipped)")
+    if not regions:
+        return []
+
+    # A long region (continuous dialogue, a music bed) is cut into
+    # overlapping windows like a whole file, so it spreads across the pool;
+    # every window of every region goes in one job list, then each region's
+    # windows are stitched. Regions don't overlap, so they just concatenate
+    region_windows = [[(start + s, start + e) for s, e in split_windows(end - start)]
+                      for start, end in regions]
+    windows = [w for ws in region_windows for w in ws]
+    results = _run_windows({path: windows}, model_name, workers, options or {}, cache)[path]
+    segments = []
+    for ws in region_windows:
+        segments.extend(stitch(ws, results[:len(ws)]))
+        results = results[len(ws):]
+    return [dict(seg, id=i) for i, seg in enumerate(segments)]
+
+def batch_files(dirs=BATCH_DIRS):
+    paths = []
+    for d in dirs:
+        paths.extend(sorted(glob.glob(os.path.join(d, "*.mp3"))))
+    return paths
+
+def scaling_benchmark(path, model_name="base", max_workers=None):
+    # Wall-clock time from 1 to N workers (pool start-up and model load
+    # included, since that's what a real run pays)
+    max_workers = max_workers or os.cpu_count() or 1
+    print(f"Scaling benchmark on {path}")
+    base = None
+    for n in range(1, max_workers + 1):
+        t0 = time.perf_counter()
+        transcribe_parallel(path, model_name, workers=n)
+        elapsed = time.perf_counter() - t0
+        base = base or elapsed
+        print(f"  {n} worker(s): {elapsed:.1f}s  speedup {base / elapsed:.2f}x")
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import time
+
+from pcm_cache import load_pcm
+
+# Resident whisper worker. Keeps models loaded between jobs so repeat
+# transcriptions skip the multi-second load/warm-up. Jobs arrive over a
+# Unix socket as one JSON line and get one JSON line back:
+#
+#   -> {"audio": "/abs/path.mp3", "model": "base", "options": {...}}
+#   <- {"segments": [...], "elapsed": 1.23}   or   {"error": "..."}
+#
+# Start it with `python whisper_worker.py --models base`; transcribe_audio.py
+# uses it automatically when the socket is up and falls back to in-process
+# whisper when it isn't.
+
+SOCKET_PATH = os.environ.get("WHISPER_SOCKET", "/tmp/xmas_whisper.sock")
+DEFAULT_MODEL = "base"
+SAMPLE_RATE = 16000  # whisper.audio.SAMPLE_RATE
+
+_models = {}
+
+def get_model(name):
+    if name not in _models:
+        import whisper
+        print(f"Loading model {name}...")
+        _models[name] = whisper.load_model(name)
+    return _models[name]
+
+def load_audio(path):
+    # 16 kHz mono float32 from the shared PCM cache
+    return load_pcm(path, sample_rate=SAMPLE_RATE, channels=1, fmt="f32le").mono()
+
+def run_job(job):
+    model = get_model(job.get("model", DEFAULT_MODEL))
+    audio = job["audio"]
+    if isinstance(audio, str):
+        audio = load_audio(audio)
+    result = model.transcribe(audio, **job.get("options", {}))
+    return result["segments"]
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        t0 = time.perf_counter()
+        try:
+            job = json.loads(line)
+            if job.get("ping"):
+                reply = {"models": sorted(_models)}
+            else:
+                reply = {"segments": run_job(job)}
+        except Exception as e:
+            reply = {"error": f"{e.__class__.__name__}: {e}"}
+        reply["elapsed"] = time.perf_counter() - t0
+        self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+        if "error" in reply:
+            print(f"Job failed: {reply['error']}")
+        else:
+            print(f"Job done in {reply['elapsed']:.2f}s")
+
+def serve(models=(DEFAULT_MODEL,), socket_path=SOCKET_PATH):
+    for name in models:
+        get_model(name)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    # Jobs are handled one at a time: one model instance isn't thread-safe
+    with socketserver.UnixStreamServer(socket_path, JobHandler) as server:
+        print(f"Whisper worker listening on {socket_path} (models: {', '.join(sorted(_models))})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+def request(job, socket_path=SOCKET_PATH, timeout=None):
+    """Send a job to a running worker.
+
+    Returns the reply dict, or None when no worker is listening.
+    """
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+    if not line:
+        raise RuntimeError("Whisper worker closed the connection without replying")
+    return json.loads(line)
+
+def transcribe_remote(audio_path, model=DEFAULT_MODEL, options=None, socket_path=SOCKET_PATH):
+    # Segments from the worker, or None if it isn't running
+    reply = request({
+        "audio": os.path.abspath(audio_path),
+        "model": model,
+        "options": options or {},
+    }, socket_path=socket_path)
+    if reply is None:
+        return None
+    if "error" in reply:
+        raise RuntimeError(f"Whisper worker: {reply['error']}")
+    return reply["segments"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep whisper models resident and serve transcription jobs")
+    parser.add_argument("--models", nargs="+", default=[DEFAULT_MODEL],
+                        help="models to preload (others load on first use)")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    args = parser.parse_args()
+    serve(args.models, args.socket)
@@ -0,0 +1,107 @@
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+# Content-hashed asset output shared by build_game.py, build_toy_factory.py
+# and embed_assets.py. Instead of base64-inlining every PNG/MP3 into the
+# page, each asset is copied to bundle/<name>.<hash><ext> and the page
+# references that file, so browsers can cache assets forever and a code
+# edit only re-downloads the HTML. Assets at or below the inline limit are
+# still inlined as data URIs (saves a request for tiny files).
+#
+# bundle/manifest.json maps each source path (relative to www/) to its
+# hashed file; it is shared by all builders.
+
+WWW_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_DIR = "bundle"
+MANIFEST_FILE = os.path.join(BUNDLE_DIR, "manifest.json")
+INLINE_LIMIT = 4 * 1024  # bytes
+
+MIME_TYPES = {".mp3": "audio/mp3", ".jpg": "image/jpeg", ".png": "image/png"}
+
+def mime_type(path):
+    ext = os.path.splitext(path)[1].lower()
+    return MIME_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def data_uri(path):
+    with open(path, "rb") as f:
+        return f"data:{mime_type(path)};base64,{base64.b64encode(f.read()).decode('utf-8')}"
+
+class AssetBundle:
+    def __init__(self, inline_limit=INLINE_LIMIT, www_dir=WWW_DIR):
+        self.www_dir = www_dir
+        self.inline_limit = inline_limit
+        self.manifest_path = os.path.join(www_dir, MANIFEST_FILE)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+            # Entries keyed by a generated file (assets/.sprites/...) came
+            # from builds before url() took a key; drop them so their files
+            # are pruned
+            self.manifest = {k: v for k, v in self.manifest.items()
+                             if not any(part.startswith(".") for part in k.split("/"))}
+        self.written = 0
+        self.inlined = 0
+
+    def url(self, rel_path, key=None):
+        """URL for an asset (path relative to www/): a data URI or bundle/ file.
+
+        key is the manifest entry (default rel_path). Give the source asset
+        when rel_path is a generated file (resized sprite, atlas sheet), so
+        a rebuild replaces the entry and the old bundle file gets pruned.
+        """
+        path = os.path.join(self.www_dir, rel_path)
+        if not os.path.exists(path):
+            print(f"Warning: File not found: {path}")
+            return ""
+
+        key = (key or rel_path).replace(os.sep, "/")
+        size = os.path.getsize(path)
+        if size <= self.inline_limit:
+            self.manifest.pop(key, None)
+            self.inlined += 1
+            return data_uri(path)
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        stem = os.path.splitext(os.path.basename(key))[0]
+        ext = os.path.splitext(rel_path)[1]
+        # Spaces in "Oil Can.png" etc. would need escaping in CSS/HTML
+        name = f"{stem.replace(' ', '_')}.{digest[:10]}{ext.lower()}"
+        hashed = f"{BUNDLE_DIR}/{name}"
+
+        out_path = os.path.join(self.www_dir, hashed)
+        if not os.path.exists(out_path):
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            shutil.copyfile(path, out_path)
+            self.written += 1
+        self.manifest[key] = {"file": hashed, "sha256": digest, "size": size}
+        return hashed
+
+    def forget(self, prefix):
+        """Drop manifest entries whose key starts with prefix (e.g. an atlas's old sheets)."""
+        for key in [k for k in self.manifest if k.startswith(prefix)]:
+            del self.manifest[key]
+
+    def save(self):
+        # Drop bundle files no manifest entry points at any more
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        live = {os.path.basename(entry["file"]) for entry in self.manifest.values()}
+        live.add(os.path.basename(MANIFEST_FILE))
+        removed = 0
+        bundle_dir = os.path.join(self.www_dir, BUNDLE_DIR)
+        for name in os.listdir(bundle_dir) if os.path.isdir(bundle_dir) else []:
+            if name not in live and not name.startswith("."):
+                os.remove(os.path.join(bundle_dir, name))
+                removed += 1
+        print(f"Bundle: {self.written} new files, {self.inlined} inlined, {removed} stale removed "
+              f"({len(self.manifest)} in {MANIFEST_FILE})")
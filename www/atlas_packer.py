@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from asset_bundle import WWW_DIR
+from optimize_sprites import PALETTE_COLORS
+
+# Packs a game's sprites into one or two power-of-two sheets, so the page
+# decodes and uploads a couple of textures instead of one per sprite, and
+# every draw samples the same image.
+#
+# The frame map keeps the game's asset IDs as keys:
+#   {"sheets": [{"file": "assets/.atlas/<name>.<key>.0.png", "width": w, "height": h}, ...],
+#    "frames": {"CLAW": {"sheet": 0, "x": 0, "y": 0, "w": 682, "h": 1024}, ...}}
+# A sprite larger than MAX_SHEET isn't packed; it gets a sheet of its own
+# (the original file) with one full-size frame, so the page handles both
+# the same way.
+#
+# Sheets and map are cached in ATLAS_CACHE keyed by the input hashes; only
+# the latest build of each atlas is kept. Bundle sheets with
+# sheet_key(name, i) so the bundle manifest entry is stable too.
+
+ATLAS_CACHE = "assets/.atlas"
+MAX_SHEET = 1024  # largest sheet side; every tablet GPU takes 1024x1024 textures
+PADDING = 2  # transparent gap between sprites so filtering doesn't bleed
+ATLAS_COLORS = PALETTE_COLORS  # one palette for the whole sheet, if it's close enough (below)
+MAX_FRAME_ERROR = 1.0  # mean abs error per channel any frame may pick up from the shared palette
+
+def pot_sizes(min_w, min_h, max_size):
+    # Power-of-two (w, h) at least min_w x min_h, smallest area first
+    sides = [1 << i for i in range(max_size.bit_length()) if (1 << i) <= max_size]
+    sizes = [(w, h) for w in sides for h in sides if w >= min_w and h >= min_h]
+    return sorted(sizes, key=lambda s: (s[0] * s[1], abs(s[0] - s[1])))
+
+def skyline_pack(rects, width, height, padding=PADDING):
+    """Bottom-left skyline packing of {id: (w, h)}; returns {id: (x, y)} for those that fit."""
+    skyline = [[0, 0, width]]  # segments of (x, y, width)
+    placed = {}
+    for rid, (w, h) in sorted(rects.items(), key=lambda r: (-r[1][1], -r[1][0], r[0])):
+        best = None
+        for i in range(len(skyline)):
+            x = skyline[i][0]
+            if x + w > width:
+                break
+            # Resting height is the highest segment under the rect's span
+            y, span, j = 0, 0, i
+            while span < w + padding and j < len(skyline):
+                y = max(y, skyline[j][1])
+                span += skyline[j][2]
+                j += 1
+            if y + h <= height and (best is None or (y + h, x) < (best[1] + h, best[0])):
+                best = (x, y)
+        if best is None:
+            continue
+        x, y = best
+        placed[rid] = best
+
+        # Raise the skyline under the rect (+ padding), then merge equal runs
+        right = min(x + w + padding, width)
+        new = []
+        for sx, sy, sw in skyline:
+            if sx + sw <= x or sx >= right:
+                new.append([sx, sy, sw])
+                continue
+            if sx < x:
+                new.append([sx, sy, x - sx])
+            if sx + sw > right:
+                new.append([right, sy, sx + sw - right])
+        new.append([x, y + h + padding, right - x])
+        new.sort()
+        skyline = []
+        for seg in new:
+            if skyline and skyline[-1][1] == seg[1]:
+                skyline[-1][2] += seg[2]
+            else:
+                skyline.append(seg)
+    return placed
+
+def plan_sheets(sizes, max_size=MAX_SHEET, padding=PADDING):
+    # Smallest power-of-two sheet that takes everything left; if even
+    # max_size x max_size doesn't, fill that and start another sheet
+    remaining = dict(sizes)
+    sheets = []
+    while remaining:
+        min_w = max(w for w, _ in remaining.values())
+        min_h = max(h for _, h in remaining.values())
+        candidates = pot_sizes(min_w, min_h, max_size)
+        for sheet_size in candidates:
+            placed = skyline_pack(remaining, *sheet_size, padding=padding)
+            if len(placed) == len(remaining):
+                break
+        else:
+            sheet_size = (max_size, max_size)
+            placed = skyline_pack(remaining, *sheet_size, padding=padding)
+        sheets.append((sheet_size, placed))
+        for rid in placed:
+            del remaining[rid]
+    return sheets
+
+def atlas_key(frames, max_size, padding, www_dir):
+    h = hashlib.sha256(json.dumps([max_size, padding, ATLAS_COLORS, MAX_FRAME_ERROR]).encode())
+    for fid in sorted(frames):
+        with open(os.path.join(www_dir, frames[fid]), "rb") as f:
+            h.update(fid.encode() + b"\0" + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()[:10]
+
+def encode_sheet(sheet, rects):
+    # The sprites were each quantized to their own palette; forcing them
+    # all into one shared palette can shift colours visibly. Keep the
+    # quantized sheet only if every frame stays within MAX_FRAME_ERROR of
+    # the full-colour sheet, else write full-colour RGBA.
+    out = io.BytesIO()
+    sheet.save(out, "PNG", optimize=True)
+    full = out.getvalue()
+    if not ATLAS_COLORS:
+        return full, False
+    quantized = sheet.quantize(colors=ATLAS_COLORS, method=Image.Quantize.FASTOCTREE)
+    a = np.asarray(sheet, dtype=np.int16)
+    b = np.asarray(quantized.convert("RGBA"), dtype=np.int16)
+    for x, y, w, h in rects:
+        frame, frame_q = a[y:y + h, x:x + w], b[y:y + h, x:x + w]
+        opaque = frame[..., 3] > 0
+        if opaque.any() and np.abs(frame_q - frame)[opaque].mean() > MAX_FRAME_ERROR:
+            return full, False
+    out = io.BytesIO()
+    quantized.save(out, "PNG", optimize=True)
+    return (out.getvalue(), True) if len(out.getvalue()) < len(full) else (full, False)
+
+def build_atlas(name, frames, max_size=MAX_SHEET, padding=PADDING, www_dir=WWW_DIR):
+    """Pack {asset ID: image path (relative to www/)} into sheets; returns the frame map."""
+    key = atlas_key(frames, max_size, padding, www_dir)
+    out_dir = os.path.join(www_dir, ATLAS_CACHE)
+    map_path = os.path.join(out_dir, f"{name}.{key}.json")
+    if os.path.exists(map_path):
+        with open(map_path, "r") as f:
+            return json.load(f)
+
+    images = {}
+    for fid, rel_path in frames.items():
+        with Image.open(os.path.join(www_dir, rel_path)) as img:
+            images[fid] = img.convert("RGBA")
+
+    atlas = {"sheets": [], "frames": {}}
+    oversized = {fid for fid, img in images.items() if max(img.size) > max_size}
+    for fid in sorted(oversized):
+        print(f"{frames[fid]} is bigger than {max_size}px; not packed")
+        w, h = images[fid].size
+        atlas["frames"][fid] = {"sheet": len(atlas["sheets"]), "x": 0, "y": 0, "w": w, "h": h}
+        atlas["sheets"].append({"file": frames[fid], "width": w, "height": h})
+
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = {fid: img.size for fid, img in images.items() if fid not in oversized}
+    for (sheet_w, sheet_h), placed in plan_sheets(sizes, max_size, padding):
+        sheet = Image.new("RGBA", (sheet_w, sheet_h), (0, 0, 0, 0))
+        index = len(atlas["sheets"])
+        for fid, (x, y) in placed.items():
+            sheet.paste(images[fid], (x, y))
+            w, h = images[fid].size
+            atlas["frames"][fid] = {"sheet": index, "x": x, "y": y, "w": w, "h": h}
+        sheet_file = f"{ATLAS_CACHE}/{name}.{key}.{index}.png"
+        data, paletted = encode_sheet(sheet, [(x, y, *images[fid].size) for fid, (x, y) in placed.items()])
+        if not paletted:
+            print(f"Sheet {index}: shared palette too lossy, saved full-colour")
+        with open(os.path.join(www_dir, sheet_file), "wb") as f:
+            f.write(data)
+        atlas["sheets"].append({"file": sheet_file, "width": sheet_w, "height": sheet_h})
+
+    with open(map_path, "w") as f:
+        json.dump(atlas, f, indent=2, sort_keys=True)
+    prune_atlas(name, key, out_dir)
+    return atlas
+
+def prune_atlas(name, key, out_dir):
+    # Sheets and maps from earlier builds of this atlas (edited sprites,
+    # other settings); other atlases' files are left alone
+    prefix = f"{name}."
+    for fname in os.listdir(out_dir):
+        if fname.startswith(prefix) and not fname.startswith(f"{prefix}{key}."):
+            os.remove(os.path.join(out_dir, fname))
+
+def sheet_key(name, index):
+    return f"atlas/{name}_{index}"
+
+def atlas_report(atlas, www_dir=WWW_DIR):
+    used = sum(f["w"] * f["h"] for f in atlas["frames"].values())
+    total = sum(s["width"] * s["height"] for s in atlas["sheets"])
+    size = sum(os.path.getsize(os.path.join(www_dir, s["file"])) for s in atlas["sheets"])
+    sheets = ", ".join(f"{s['width']}x{s['height']}" for s in atlas["sheets"])
+    print(f"Atlas: {len(atlas['frames'])} sprites in {len(atlas['sheets'])} sheets ({sheets}), "
+          f"{used / total:.0%} filled, {size // 1024}K")
+
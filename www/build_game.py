@@ -1,21 +1,38 @@
 
-import base64
+import argparse
 import os
 
-assets_dir = '/Users/nickcuskey/xmasLockboxes/www/assets/elf_game'
-output_path = '/Users/nickcuskey/xmasLockboxes/www/elf_game.html'
+import optimize_sprites
+from asset_bundle import INLINE_LIMIT, WWW_DIR, AssetBundle
+from optimize_sprites import SPRITE_SIZES
 
-def get_b64(filename):
-    path = os.path.join(assets_dir, filename)
-    with open(path, 'rb') as f:
-        return base64.b64encode(f.read()).decode('utf-8')
+parser = argparse.ArgumentParser(description="Build elf_game.html")
+parser.add_argument("--inline-limit", type=int, default=INLINE_LIMIT,
+                    help="inline assets up to this many bytes as data URIs; larger ones go to bundle/")
+optimize_sprites.add_arguments(parser)
+args = parser.parse_args()
+
+assets_dir = 'assets/elf_game'
+output_path = os.path.join(WWW_DIR, 'elf_game.html')
+bundle = AssetBundle(inline_limit=args.inline_limit)
+sprites = optimize_sprites.from_args(args)
+
+def get_url(filename):
+    source = f'{assets_dir}/{filename}'
+    return bundle.url(sprites.path(source), key=source)
+
+# Sprites are drawn at a fixed size (setDisplaySize), not a scale of the
+# texture, so the game looks the same whatever resolution they're bundled at
+elf_w, elf_h = SPRITE_SIZES[f'{assets_dir}/elf_spritesheet.png']['size']
+present_w, present_h = SPRITE_SIZES[f'{assets_dir}/present.png']['size']
+coal_w, coal_h = SPRITE_SIZES[f'{assets_dir}/coal.png']['size']
 
 # Load assets
-elf_sheet_b64 = get_b64('elf_spritesheet.png')
+elf_sheet_url = get_url('elf_spritesheet.png')
 # Use the old static image if you want an idle frame, or just use frame 0 of sheet
-present_b64 = get_b64('present.png')
-coal_b64 = get_b64('coal.png')
-bg_b64 = get_b64('background.png')
+present_url = get_url('present.png')
+coal_url = get_url('coal.png')
+bg_url = get_url('background.png')
 
 html_content = f"""<!DOCTYPE html>
 <html lang="en">
@@ -46,10 +63,10 @@ html_content = f"""<!DOCTYPE html>
 <body>
     <!-- Hidden Assets for direct loading -->
     <div style="display:none;">
-        <img id="asset_elf_sheet" src="data:image/png;base64,{elf_sheet_b64}" />
-        <img id="asset_present" src="data:image/png;base64,{present_b64}" />
-        <img id="asset_coal" src="data:image/png;base64,{coal_b64}" />
-        <img id="asset_background" src="data:image/png;base64,{bg_b64}" />
+        <img id="asset_elf_sheet" src="{elf_sheet_url}" />
+        <img id="asset_present" src="{present_url}" />
+        <img id="asset_coal" src="{coal_url}" />
+        <img id="asset_background" src="{bg_url}" />
     </div>
 
     <div id="game-container"></div>
@@ -121,7 +138,7 @@ html_content = f"""<!DOCTYPE html>
             player = this.physics.add.sprite(100, 450, 'elf_anim', 0);
             player.setBounce(0.1);
             player.setCollideWorldBounds(true);
-            player.setScale(0.5); // Adjust based on new sprite size. 
+            player.setDisplaySize({elf_w // 4}, {elf_h}); // One of 4 frames
             
             // Adjust body size for better collision
             player.body.setSize(player.width * 0.4, player.height * 0.8);
@@ -205,7 +222,7 @@ html_content = f"""<!DOCTYPE html>
             if (gameOver) return;
             const x = Phaser.Math.Between(50, 750);
             const present = presents.create(x, 0, 'present');
-            present.setScale(0.1);
+            present.setDisplaySize({present_w}, {present_h});
             present.setBounce(0.4);
             present.setCollideWorldBounds(false);
             present.setVelocityY(Phaser.Math.Between(100, 200));
@@ -215,7 +232,7 @@ html_content = f"""<!DOCTYPE html>
             if (gameOver) return;
             const x = Phaser.Math.Between(50, 750);
             const coal = coals.create(x, 0, 'coal');
-            coal.setScale(0.1);
+            coal.setDisplaySize({coal_w}, {coal_h});
             coal.setVelocityY(Phaser.Math.Between(200, 400));
             coal.setAngularVelocity(Phaser.Math.Between(-100, 100));
         }}
@@ -255,5 +272,7 @@ html_content = f"""<!DOCTYPE html>
 
 with open(output_path, 'w') as f:
     f.write(html_content)
+bundle.save()
+sprites.report()
 
-print(f"Rebuilt {output_path} with transparent animations.")
+print(f"Rebuilt {output_path} with transparent animations ({len(html_content) / 1024:.0f} KB).")
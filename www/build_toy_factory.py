@@ -1,11 +1,24 @@
-
-import base64
+import argparse
+import json
 import os
-import re
 
-# Configuration
-SOURCE_DIR = '/Users/nickcuskey/xmasLockboxes/www'
-ASSETS_DIR = os.path.join(SOURCE_DIR, 'assets/toy_factory')
+import optimize_sprites
+from asset_bundle import INLINE_LIMIT, WWW_DIR, AssetBundle
+from atlas_packer import MAX_SHEET, atlas_report, build_atlas, sheet_key
+
+parser = argparse.ArgumentParser(description="Build sam.html from toy_factory.html")
+parser.add_argument("--inline-limit", type=int, default=INLINE_LIMIT,
+                    help="inline assets up to this many bytes as data URIs; larger ones go to bundle/")
+optimize_sprites.add_arguments(parser)
+parser.add_argument("--no-atlas", action="store_true",
+                    help="bundle each sprite as its own file instead of packing them into sheets")
+parser.add_argument("--atlas-max-size", type=int, default=MAX_SHEET,
+                    help=f"largest atlas sheet side in pixels (default {MAX_SHEET})")
+args = parser.parse_args()
+
+# Configuration (asset paths are relative to www/)
+SOURCE_DIR = WWW_DIR
+ASSETS_DIR = 'assets/toy_factory'
 SOURCE_HTML = os.path.join(SOURCE_DIR, 'toy_factory.html')
 OUTPUT_HTML = os.path.join(SOURCE_DIR, 'sam.html')
 
@@ -31,29 +44,8 @@ GAME_ASSETS = {
 BACKGROUND_FILE = 'background.png'
 MUSIC_FILE = 'Merry Merry Everywhere.mp3'
 
-def get_b64_image(filepath):
-    """Reads an image and returns a base64 data URI."""
-    if not os.path.exists(filepath):
-        print(f"Warning: File not found: {filepath}")
-        return ""
-    
-    ext = os.path.splitext(filepath)[1].lower().replace('.', '')
-    mime_type = f"image/{ext}"
-    if ext == 'jpg': mime_type = 'image/jpeg'
-    
-    with open(filepath, 'rb') as f:
-        data = base64.b64encode(f.read()).decode('utf-8')
-        return f"data:{mime_type};base64,{data}"
-
-def get_b64_audio(filepath):
-    """Reads an audio file and returns a base64 data URI."""
-    if not os.path.exists(filepath):
-        print(f"Warning: File not found: {filepath}")
-        return ""
-    
-    with open(filepath, 'rb') as f:
-        data = base64.b64encode(f.read()).decode('utf-8')
-        return f"data:audio/mp3;base64,{data}"
+bundle = AssetBundle(inline_limit=args.inline_limit)
+sprites = optimize_sprites.from_args(args)
 
 print("Building sam.html...")
 
@@ -62,30 +54,39 @@ with open(SOURCE_HTML, 'r') as f:
     html_content = f.read()
 
 # 2. Prepare Asset Bundle
+# Each value is a bundle/ URL (or a data URI for tiny files); the page
+# loads them the same way either way
 embedded_assets = {}
 
 # Game Sprite Assets
-# Game Sprite Assets
-for asset_id, filename in GAME_ASSETS.items():
-    path = os.path.join(ASSETS_DIR, filename)
-    print(f"Embedding {filename}...")
-    embedded_assets[asset_id] = get_b64_image(path)
+# The page draws sprites by their frame width/height, so resized ones drop in as-is
+sprite_paths = {asset_id: sprites.path(f"{ASSETS_DIR}/{filename}") for asset_id, filename in GAME_ASSETS.items()}
+atlas = None
+if args.no_atlas:
+    bundle.forget(sheet_key('toy_factory', ''))
+    for asset_id, path in sprite_paths.items():
+        print(f"Bundling {path}...")
+        embedded_assets[asset_id] = bundle.url(path, key=f"{ASSETS_DIR}/{GAME_ASSETS[asset_id]}")
+else:
+    # Packed into sheets; the page looks frames up by the same asset IDs
+    print(f"Packing {len(sprite_paths)} sprites into an atlas...")
+    atlas = build_atlas('toy_factory', sprite_paths, max_size=args.atlas_max_size)
+    # Drop the separate-file entries a --no-atlas build left
+    for filename in GAME_ASSETS.values():
+        bundle.forget(f"{ASSETS_DIR}/{filename}")
+    atlas_report(atlas)
 
 # Music
-music_path = os.path.join(SOURCE_DIR, MUSIC_FILE)
-print(f"Embedding music: {MUSIC_FILE}...")
-embedded_assets['MUSIC'] = get_b64_audio(music_path)
+print(f"Bundling music: {MUSIC_FILE}...")
+embedded_assets['MUSIC'] = bundle.url(MUSIC_FILE)
 
 # Background
-bg_path = os.path.join(ASSETS_DIR, BACKGROUND_FILE)
-print(f"Embedding background: {BACKGROUND_FILE}...")
-bg_b64 = get_b64_image(bg_path)
+print(f"Bundling background: {BACKGROUND_FILE}...")
+bg_url = bundle.url(f"{ASSETS_DIR}/{BACKGROUND_FILE}")
 
 # Start Screen
-start_bg_path = os.path.join(SOURCE_DIR, 'background_factory.jpg')
-print(f"Embedding start background: background_factory.jpg...")
-start_bg_b64 = get_b64_image(start_bg_path)
-embedded_assets['START_BG'] = start_bg_b64
+print(f"Bundling start background: background_factory.jpg...")
+embedded_assets['START_BG'] = bundle.url('background_factory.jpg')
 
 
 # 3. Inject Assets into HTML
@@ -101,6 +102,15 @@ js_bundle = "window.EMBEDDED_ASSETS = {\n"
 for key, val in embedded_assets.items():
     js_bundle += f"    '{key}': '{val}',\n"
 js_bundle += "};\n"
+if atlas:
+    # The sheet count can change between builds
+    bundle.forget(sheet_key('toy_factory', ''))
+    page_atlas = {
+        'sheets': [bundle.url(sheet['file'], key=sheet_key('toy_factory', i))
+                   for i, sheet in enumerate(atlas['sheets'])],
+        'frames': atlas['frames'],
+    }
+    js_bundle += f"window.ATLAS = {json.dumps(page_atlas, sort_keys=True)};\n"
 
 # Inject into the <script> block. We'll look for `const canvas =` which starts the main logic
 html_content = html_content.replace(
@@ -111,7 +121,7 @@ html_content = html_content.replace(
 # B. Replace CSS Background
 html_content = html_content.replace(
     "url('background.png')",
-    f"url('{bg_b64}')"
+    f"url('{bg_url}')"
 )
 
 # C. Clean up Audio Tag (Optional, since JS handles it, but good to be clean)
@@ -126,5 +136,7 @@ html_content = html_content.replace(
 # 4. Write Output
 with open(OUTPUT_HTML, 'w') as f:
     f.write(html_content)
+bundle.save()
+sprites.report()
 
 print(f"Success! Generated {OUTPUT_HTML} ({len(html_content) / 1024 / 1024:.2f} MB)")
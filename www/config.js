@@ -16,5 +16,6 @@ const CONFIG = {
         { id: "jacob", name: "Jacob's Box", topic: "lockbox/3" }
     ],
     // Show Assets
-    SHOW_SEQUENCE: "show_sequence.json"
+    SHOW_SEQUENCE: "show_sequence.json",
+    SHOW_TIMELINE: "show_timeline.json" // indexed copy, from show_timeline.py
 };
@@ -1,9 +1,14 @@
-
-import base64
+import argparse
 import os
 
-html_path = '/Users/nickcuskey/xmasLockboxes/www/elf_game.html'
-assets_dir = '/Users/nickcuskey/xmasLockboxes/www/assets/elf_game'
+from asset_bundle import INLINE_LIMIT, WWW_DIR, AssetBundle
+
+parser = argparse.ArgumentParser(description="Point elf_game.html's asset paths at bundled files")
+parser.add_argument("--inline-limit", type=int, default=INLINE_LIMIT,
+                    help="inline assets up to this many bytes as data URIs; larger ones go to bundle/")
+args = parser.parse_args()
+
+html_path = os.path.join(WWW_DIR, 'elf_game.html')
 
 assets = {
     'background.png': 'assets/elf_game/background.png',
@@ -12,17 +17,17 @@ assets = {
     'coal.png': 'assets/elf_game/coal.png'
 }
 
+bundle = AssetBundle(inline_limit=args.inline_limit)
+
 with open(html_path, 'r') as f:
     content = f.read()
 
 for filename, placeholder in assets.items():
-    file_path = os.path.join(assets_dir, filename)
-    with open(file_path, 'rb') as img_file:
-        b64_data = base64.b64encode(img_file.read()).decode('utf-8')
-        data_uri = f"data:image/png;base64,{b64_data}"
-        content = content.replace(placeholder, data_uri)
+    if placeholder in content:
+        content = content.replace(placeholder, bundle.url(placeholder))
 
 with open(html_path, 'w') as f:
     f.write(content)
+bundle.save()
 
-print("Assets embedded successfully.")
+print("Assets bundled successfully.")
@@ -133,5 +133,69 @@ class ScriptSequencer {
     }
 }
 
+// Seekable show timeline built by show_timeline.py (show_timeline.json).
+// Every lookup is a binary search, so scrubbing/resuming doesn't replay the
+// whole event list.
+class ShowTimeline {
+    constructor(index) {
+        this.times = index.times;
+        this.events = index.events;
+        this.boxes = {};
+        Object.entries(index.boxes).forEach(([box, spans]) => {
+            this.boxes[box] = {
+                starts: spans.starts,
+                ends: spans.ends.map(e => e === null ? Infinity : e)
+            };
+        });
+    }
+
+    static async load(url = 'show_timeline.json') {
+        const res = await fetch(url);
+        return new ShowTimeline(await res.json());
+    }
+
+    // First index in sorted arr with arr[i] > t (or >= t when inclusive)
+    static bisect(arr, t, inclusive = false) {
+        let lo = 0;
+        let hi = arr.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (arr[mid] < t || (!inclusive && arr[mid] === t)) lo = mid + 1;
+            else hi = mid;
+        }
+        return lo;
+    }
+
+    isActive(box, t) {
+        const spans = this.boxes[box];
+        if (!spans) return false;
+        const i = ShowTimeline.bisect(spans.starts, t) - 1;
+        return i >= 0 && t < spans.ends[i];
+    }
+
+    activeBoxes(t) {
+        return Object.keys(this.boxes).filter(box => this.isActive(box, t));
+    }
+
+    // Index of the first event after t: where a player resumes from
+    indexAt(t) {
+        return ShowTimeline.bisect(this.times, t);
+    }
+
+    nextEvents(t, n = 1) {
+        const i = this.indexAt(t);
+        return this.events.slice(i, i + n);
+    }
+
+    // Events with a <= time < b
+    window(a, b) {
+        return this.events.slice(
+            ShowTimeline.bisect(this.times, a, true),
+            ShowTimeline.bisect(this.times, b, true)
+        );
+    }
+}
+
 // Make global
 window.ScriptSequencer = ScriptSequencer;
+window.ShowTimeline = ShowTimeline;
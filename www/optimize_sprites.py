@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+
+from PIL import Image, features
+
+from asset_bundle import WWW_DIR
+
+# Resizes game sprites to the size they are actually drawn at, before they
+# are bundled. The source PNGs are 1024px (or 300px) but e.g. present.png
+# is drawn at 102px, so the browser downloads and decodes ~100x the pixels
+# it needs - slow on the low-end tablets.
+#
+# SPRITE_SIZES is the largest on-screen box (CSS px, width x height) each
+# sprite is drawn in; 0 means that side is unconstrained. The image is
+# scaled to fit that box times --scale (2 for HiDPI screens), keeping its
+# aspect ratio and never upscaling. Sprites not listed pass through as-is.
+#
+# Output goes to SPRITE_CACHE keyed by source hash + settings, so unchanged
+# sprites aren't re-encoded.
+
+SPRITE_CACHE = "assets/.sprites"
+HIDPI_SCALE = 2
+PALETTE_COLORS = 256
+
+SPRITE_SIZES = {
+    # elf_game.html: 800x600 canvas
+    # Square background stretched to 800x600: keep the full 800 width, and
+    # no palette (it is a photo, quantizing would band)
+    "assets/elf_game/background.png": {"size": (800, 800), "colors": 0},
+    "assets/elf_game/elf_spritesheet.png": {"size": (512, 512)},  # 4 frames, drawn at half size
+    "assets/elf_game/present.png": {"size": (102, 102)},  # was setScale(0.1)
+    "assets/elf_game/coal.png": {"size": (102, 102)},
+    # sam.html: items drawn at 90px (80px target icon), claw 780px tall
+    "assets/toy_factory/claw.png": {"size": (0, 780)},
+    **{f"assets/toy_factory/{name}.png": {"size": (90, 90)} for name in [
+        "Car", "Present", "Robot", "Teddy", "Top", "Train",
+        "Bolt", "Cog", "Hammer", "Oil Can", "Scrap", "Wrench",
+    ]},
+}
+
+def fit_size(src_size, box, scale):
+    # Largest size within box * scale with the source's aspect ratio
+    w, h = src_size
+    limits = [side * scale / src for side, src in zip(box, (w, h)) if side]
+    ratio = min([1.0] + limits)
+    return max(1, round(w * ratio)), max(1, round(h * ratio))
+
+def encode_png(img, colors):
+    # Palette-quantized PNG if it's smaller than the full-colour one
+    out = io.BytesIO()
+    img.save(out, "PNG", optimize=True)
+    best = out.getvalue()
+    if colors:
+        # FASTOCTREE is the quantizer that keeps the alpha channel
+        method = Image.Quantize.FASTOCTREE if img.mode == "RGBA" else Image.Quantize.MEDIANCUT
+        out = io.BytesIO()
+        img.quantize(colors=colors, method=method).save(out, "PNG", optimize=True)
+        if len(out.getvalue()) < len(best):
+            best = out.getvalue()
+    return best
+
+def encode_webp(img):
+    out = io.BytesIO()
+    img.save(out, "WEBP", quality=85, method=6)
+    return out.getvalue()
+
+class SpriteOptimizer:
+    def __init__(self, scale=HIDPI_SCALE, webp=False, enabled=True, www_dir=WWW_DIR):
+        self.www_dir = www_dir
+        self.scale = scale
+        self.webp = webp and features.check("webp")
+        if webp and not self.webp:
+            print("Warning: this Pillow has no WebP support; writing PNG only")
+        self.enabled = enabled
+        self.report_rows = []
+
+    def path(self, rel_path):
+        """Path (relative to www/) of the sprite to bundle for rel_path."""
+        config = SPRITE_SIZES.get(rel_path.replace(os.sep, "/"))
+        src = os.path.join(self.www_dir, rel_path)
+        if not self.enabled or config is None or not os.path.exists(src):
+            return rel_path
+
+        with open(src, "rb") as f:
+            source = f.read()
+        settings = {
+            "size": config["size"],
+            "colors": config.get("colors", PALETTE_COLORS),
+            "scale": self.scale,
+            "webp": self.webp,
+        }
+        key = hashlib.sha256(source + json.dumps(settings, sort_keys=True).encode()).hexdigest()[:10]
+        stem, ext = os.path.splitext(os.path.basename(rel_path))
+        out_dir = os.path.join(self.www_dir, SPRITE_CACHE)
+        meta_path = os.path.join(out_dir, f"{stem}.{key}.json")
+
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        else:
+            with Image.open(io.BytesIO(source)) as img:
+                img.load()
+                src_size = img.size
+                if img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA")
+                size = fit_size(src_size, settings["size"], self.scale)
+                if size != src_size:
+                    img = img.resize(size, Image.Resampling.LANCZOS)
+                data, out_ext = encode_png(img, settings["colors"]), ".png"
+                if self.webp:
+                    webp = encode_webp(img)
+                    if len(webp) < len(data):
+                        data, out_ext = webp, ".webp"
+            # Don't swap in something bigger than the original
+            if len(data) >= len(source) and size == src_size:
+                data, out_ext = source, ext.lower()
+            out_name = f"{stem}.{key}{out_ext}"
+            os.makedirs(out_dir, exist_ok=True)
+            with open(os.path.join(out_dir, out_name), "wb") as f:
+                f.write(data)
+            meta = {"source": rel_path.replace(os.sep, "/"), "file": out_name,
+                    "source_size": list(src_size), "size": list(size),
+                    "source_bytes": len(source), "bytes": len(data)}
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+            self.prune(meta_path, meta["source"])
+
+        self.report_rows.append((rel_path, meta))
+        return f"{SPRITE_CACHE}/{meta['file']}"
+
+    def prune(self, keep_meta, source):
+        # Older outputs for the same source (other settings or an edited
+        # sprite); other sprites' entries are left alone
+        out_dir = os.path.dirname(keep_meta)
+        for name in os.listdir(out_dir):
+            meta_path = os.path.join(out_dir, name)
+            if not name.endswith(".json") or meta_path == keep_meta:
+                continue
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("source") == source:
+                stale = os.path.join(out_dir, meta["file"])
+                if os.path.exists(stale):
+                    os.remove(stale)
+                os.remove(meta_path)
+
+    def report(self):
+        # Transfer size, and decoded size (what the tablet has to hold in
+        # memory / upload to the GPU, 4 bytes per pixel)
+        if not self.report_rows:
+            return
+        print(f"{'sprite':<44} {'pixels':>19} {'bytes':>19} {'decoded':>17}")
+        totals = [0, 0, 0, 0]
+        for rel_path, meta in self.report_rows:
+            (sw, sh), (w, h) = meta["source_size"], meta["size"]
+            row = [meta["source_bytes"], meta["bytes"], sw * sh * 4, w * h * 4]
+            totals = [t + r for t, r in zip(totals, row)]
+            print(f"{os.path.basename(rel_path)[:44]:<44} {f'{sw}x{sh} -> {w}x{h}':>19} "
+                  f"{f'{row[0] // 1024}K -> {row[1] // 1024}K':>19} "
+                  f"{f'{row[2] / 2**20:.1f}M -> {row[3] / 2**20:.1f}M':>17}")
+        print(f"{'total':<44} {'':>19} {f'{totals[0] // 1024}K -> {totals[1] // 1024}K':>19} "
+              f"{f'{totals[2] / 2**20:.1f}M -> {totals[3] / 2**20:.1f}M':>17}"
+              f"  ({1 - totals[1] / totals[0]:.0%} smaller)")
+
+def add_arguments(parser):
+    parser.add_argument("--scale", type=float, default=HIDPI_SCALE,
+                        help=f"sprite pixels per on-screen pixel (default {HIDPI_SCALE} for HiDPI; 1 for smallest files)")
+    parser.add_argument("--webp", action="store_true",
+                        help="use WebP for sprites where it's smaller than PNG")
+    parser.add_argument("--no-optimize", action="store_true",
+                        help="bundle the full-resolution sprites")
+
+def from_args(args):
+    return SpriteOptimizer(scale=args.scale, webp=args.webp, enabled=not args.no_optimize)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resize game sprites to their on-screen size and report the savings")
+    add_arguments(parser)
+    args = parser.parse_args()
+    sprites = from_args(args)
+    for rel_path in SPRITE_SIZES:
+        sprites.path(rel_path)
+    sprites.report()
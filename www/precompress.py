@@ -0,0 +1,182 @@
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asset_bundle import BUNDLE_DIR, MANIFEST_FILE as BUNDLE_MANIFEST, WWW_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Writes .gz (and .br, if the brotli module is installed) next to every
+# compressible file under www/, at maximum compression, so the server can
+# send them as-is instead of compressing per request or not at all.
+# Files whose hash is unchanged since the last run are skipped.
+#
+# --serve runs a local static server that sends the precompressed variant
+# when the browser accepts it (and long-lived cache headers for the
+# content-hashed bundle/ files), to test the result.
+
+COMPRESSIBLE = {".html", ".js", ".css", ".json", ".svg", ".txt", ".map"}
+MIN_SIZE = 1024  # smaller files don't gain enough to be worth a variant
+MIN_SAVING = 0.1  # keep a variant only if it's at least this much smaller
+SKIP_DIRS = {"assets", "__pycache__"}  # sources, not served
+MANIFEST_FILE = ".precompress_manifest.json"  # source path -> hash and variant sizes
+SERVE_PORT = 8000
+
+ENCODINGS = {"gzip": ".gz"}
+if brotli is not None:
+    ENCODINGS["br"] = ".br"
+
+def find_files(www_dir=WWW_DIR):
+    for root, dirs, files in os.walk(www_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE and not name.startswith("."):
+                yield os.path.relpath(path, www_dir).replace(os.sep, "/")
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 so unchanged input gives byte-identical output
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def precompress_file(path, entry):
+    # entry is the manifest record {"sha256", "gzip": size, "br": size} for
+    # this file (size None = variant not worth keeping); returns the new one
+    with open(path, "rb") as f:
+        data = f.read()
+    new = {"sha256": hashlib.sha256(data).hexdigest()}
+    unchanged = entry is not None and entry["sha256"] == new["sha256"]
+    for encoding, ext in ENCODINGS.items():
+        out_path = path + ext
+        # Unchanged, and the variant on disk is as the manifest recorded it
+        if unchanged and encoding in entry and (entry[encoding] is None) != os.path.exists(out_path):
+            new[encoding] = entry[encoding]
+            continue
+        packed = compress(data, encoding) if len(data) >= MIN_SIZE else None
+        if packed is None or len(packed) > len(data) * (1 - MIN_SAVING):
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            new[encoding] = None
+            continue
+        with open(out_path + ".part", "wb") as f:
+            f.write(packed)
+        os.replace(out_path + ".part", out_path)
+        new[encoding] = len(packed)
+    return new
+
+def precompress_all(jobs=None, force=False, www_dir=WWW_DIR):
+    manifest_path = os.path.join(www_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    files = list(find_files(www_dir))
+    print(f"Precompressing {len(files)} files ({', '.join(ENCODINGS)})"
+          f"{'' if brotli else ' - install brotli for .br'}...")
+
+    # zlib and brotli release the GIL, so threads compress in parallel
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {rel: pool.submit(precompress_file, os.path.join(www_dir, rel), manifest.get(rel))
+                   for rel in files}
+        results = {rel: future.result() for rel, future in futures.items()}
+    changed = sum(results[rel]["sha256"] != manifest.get(rel, {}).get("sha256") for rel in files)
+
+    # Variants whose source is gone would otherwise be served forever
+    removed = 0
+    for root, dirs, names in os.walk(www_dir):
+        for name in names:
+            base, ext = os.path.splitext(name)
+            if ext in (".gz", ".br") and os.path.splitext(base)[1].lower() in COMPRESSIBLE \
+                    and not os.path.exists(os.path.join(root, base)):
+                os.remove(os.path.join(root, name))
+                removed += 1
+
+    with open(manifest_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    report(results, www_dir)
+    print(f"Done in {time.time() - start:.1f}s: {changed} changed, "
+          f"{len(files) - changed} unchanged, {removed} stale variants removed")
+
+def report(results, www_dir=WWW_DIR):
+    encodings = list(ENCODINGS)
+    print(f"{'file':<48} {'size':>9}" + "".join(f" {e:>15}" for e in encodings))
+    totals = {e: 0 for e in ["raw"] + encodings}
+    for rel, sizes in sorted(results.items(), key=lambda r: -os.path.getsize(os.path.join(www_dir, r[0]))):
+        raw = os.path.getsize(os.path.join(www_dir, rel))
+        totals["raw"] += raw
+        cols = ""
+        for e in encodings:
+            size = sizes[e]
+            # What gets sent: the variant, or the file itself if there isn't one
+            totals[e] += size if size is not None else raw
+            cols += f" {f'{size} ({size / raw:.0%})' if size is not None else '-':>15}"
+        print(f"{rel[:48]:<48} {raw:>9}{cols}")
+    raw_total = max(totals["raw"], 1)
+    print(f"{'total':<48} {totals['raw']:>9}" +
+          "".join(f" {f'{totals[e]} ({totals[e] / raw_total:.0%})':>15}" for e in encodings))
+
+class PrecompressedHandler(http.server.SimpleHTTPRequestHandler):
+    # Serves <file>.br / <file>.gz for <file> when the client accepts that
+    # encoding, with the original file's Content-Type
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?")[0].endswith("/"):
+            path = os.path.join(path, "index.html")
+        if os.path.isfile(path):
+            accepted = {e.split(";")[0].strip() for e in self.headers.get("Accept-Encoding", "").split(",")}
+            for encoding in ("br", "gzip"):
+                variant = path + {"br": ".br", "gzip": ".gz"}[encoding]
+                if encoding in accepted and os.path.isfile(variant):
+                    f = open(variant, "rb")
+                    self.send_response(200)
+                    self.send_header("Content-Type", self.guess_type(path))
+                    self.send_header("Content-Encoding", encoding)
+                    self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+                    self.send_header("Vary", "Accept-Encoding")
+                    self.end_headers()
+                    return f
+        return super().send_head()
+
+    def end_headers(self):
+        # bundle/ names change with their content, so they can be cached forever
+        request_path = self.path.split("?")[0].lstrip("/")
+        if request_path.startswith(BUNDLE_DIR + "/") and request_path != BUNDLE_MANIFEST:
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        else:
+            self.send_header("Cache-Control", "no-cache")
+        super().end_headers()
+
+def serve(port=SERVE_PORT, www_dir=WWW_DIR):
+    def handler(*args, **kwargs):
+        return PrecompressedHandler(*args, directory=www_dir, **kwargs)
+    server = http.server.ThreadingHTTPServer(("", port), handler)
+    print(f"Serving {www_dir} with precompressed variants on http://localhost:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write .gz/.br siblings of the www/ files and optionally serve them")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="parallel compressions (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="recompress every file even if its hash is unchanged")
+    parser.add_argument("--serve", nargs="?", type=int, const=SERVE_PORT, default=None, metavar="PORT",
+                        help=f"after compressing, serve www/ with the variants (default port {SERVE_PORT})")
+    args = parser.parse_args()
+    precompress_all(jobs=args.jobs, force=args.force)
+    if args.serve is not None:
+        serve(args.serve)